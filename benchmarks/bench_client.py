@@ -0,0 +1,108 @@
+"""End-to-end benchmarks of DmsClient against the local FakeDms.
+
+Usage:
+  bench_client.py [options]
+
+Options:
+  --profiles=<n>      Number of profiles [default: 2000].
+  --products=<n>      Number of products [default: 100].
+  --sales=<n>         Number of sales [default: 50000].
+  --latency=<s>       Server latency in seconds [default: 0.005].
+  --error-rate=<r>    Fraction of failing requests [default: 0].
+  --runs=<n>          Repetitions per benchmark [default: 20].
+  --writes=<n>        Number of sales of the bulk benchmark [default: 200].
+"""
+import asyncio
+import statistics
+import time
+
+from docopt import docopt
+
+from dmsclient import (DmsClient, CircuitBreaker, Retry,
+                       construct_sale_entries, profile_index)
+from dmsclient.fakeserver import FakeDms
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * len(values))))]
+
+
+def report(name, latencies, operations=None):
+    """Print latency percentiles in ms and the throughput per second"""
+    total = sum(latencies)
+    operations = operations or len(latencies)
+    print('{:<24} {:>8.2f} {:>8.2f} {:>8.2f} {:>10.1f}'.format(
+        name,
+        statistics.median(latencies) * 1000,
+        percentile(latencies, 90) * 1000,
+        percentile(latencies, 99) * 1000,
+        operations / total))
+
+
+async def timed(coro_factory, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await coro_factory()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def bench(args):
+    server = FakeDms(num_profiles=int(args['--profiles']),
+                     num_products=int(args['--products']),
+                     num_sales=int(args['--sales']),
+                     latency=float(args['--latency']),
+                     error_rate=float(args['--error-rate']))
+    url = await server.start()
+    runs = int(args['--runs'])
+    writes = int(args['--writes'])
+    try:
+        # without rate limiter, which would cap the measured throughput
+        async with DmsClient('benchmark', url,
+                             middlewares=[Retry(), CircuitBreaker()]) as client:
+            print('{:<24} {:>8} {:>8} {:>8} {:>10}'.format(
+                'benchmark', 'p50 ms', 'p90 ms', 'p99 ms', 'ops/s'))
+
+            report('load products', await timed(
+                lambda: client.products, runs))
+            report('load profiles', await timed(
+                lambda: client.profiles, runs))
+
+            profiles = await client.profiles
+            products = await client.products
+            index = profile_index(profiles)
+
+            async def search():
+                index.search('first1 last1')
+            report('search profile', await timed(search, runs * 10))
+
+            report('sale history', await timed(
+                lambda: client.sale_history(365), runs))
+
+            sales = await client.sale_history(365)
+
+            async def construct():
+                construct_sale_entries(sales, profiles, products)
+            report('construct sale entries', await timed(construct, runs))
+
+            for p in server.products:
+                p['quantity'] = writes * runs
+            items = [(products[i % len(products)].id,
+                      profiles[i % len(profiles)].id, 1)
+                     for i in range(writes)]
+            report('bulk add_sale', await timed(
+                lambda: client.submit_batch(items, concurrency=8), runs),
+                operations=writes * runs)
+    finally:
+        await server.stop()
+
+
+def main():
+    args = docopt(__doc__)
+    asyncio.get_event_loop().run_until_complete(bench(args))
+
+
+if __name__ == '__main__':
+    main()
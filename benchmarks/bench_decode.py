@@ -0,0 +1,89 @@
+"""Decoding 100k sale rows: the former strptime/kwargs path against the
+fast decode path.
+
+Usage:
+  python benchmarks/bench_decode.py [<num_sales>]
+"""
+import json
+import random
+import sys
+import time
+
+from datetime import datetime, timedelta
+
+from dmsclient.core.decode import JSON_BACKEND, json_loads
+from dmsclient.core.models import Product, Profile, SaleEntry
+from dmsclient.core.table import SaleTable
+from dmsclient.core.utility import construct_sale_entries
+
+
+def make_payloads(n, seed=0):
+    rnd = random.Random(seed)
+    profiles = [{'id': i, 'username': 'user{}'.format(i), 'email': '',
+                 'allowed_buy': True, 'first_name': 'First{}'.format(i),
+                 'last_name': 'Last{}'.format(i), 'is_staff': False,
+                 'is_current': False} for i in range(500)]
+    products = [{'id': i, 'name': 'Product {}'.format(i), 'quantity': 10,
+                 'price_cent': 70, 'displayed': True} for i in range(50)]
+    start = datetime(2018, 1, 1)
+    sales = [{'id': i, 'profile': rnd.randrange(500),
+              'product': rnd.randrange(50),
+              'date': (start + timedelta(seconds=rnd.randrange(30000000)))
+              .strftime('%Y-%m-%dT%H:%M:%S.%f')} for i in range(n)]
+    return (json.dumps(profiles).encode(), json.dumps(products).encode(),
+            json.dumps(sales).encode())
+
+
+def former(profiles, products, sales):
+    profiles = [Profile(**d) for d in json.loads(profiles)]
+    products = [Product(**d) for d in json.loads(products)]
+    profiles = {p.id: p for p in profiles}
+    products = {p.id: p for p in products}
+    return [SaleEntry(id=s['id'],
+                      profile=profiles[s['profile']],
+                      product=products[s['product']],
+                      date=datetime.strptime(s['date'],
+                                             '%Y-%m-%dT%H:%M:%S.%f'))
+            for s in json.loads(sales)]
+
+
+def fast(profiles, products, sales):
+    return construct_sale_entries(
+        json_loads(sales),
+        [Profile.from_api(d) for d in json_loads(profiles)],
+        [Product.from_api(d) for d in json_loads(products)])
+
+
+def fast_dates(profiles, products, sales):
+    entries = fast(profiles, products, sales)
+    for e in entries:
+        e.date
+    return entries
+
+
+def table(profiles, products, sales):
+    return SaleTable.from_sales(
+        json_loads(sales),
+        [Profile.from_api(d) for d in json_loads(profiles)],
+        [Product.from_api(d) for d in json_loads(products)])
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payloads = make_payloads(n)
+    print('{} sales, json backend {}'.format(n, JSON_BACKEND))
+    baseline = None
+    for name, decode in [('former (strptime)', former),
+                         ('fast, lazy dates', fast),
+                         ('fast, all dates', fast_dates),
+                         ('fast, SaleTable', table)]:
+        start = time.perf_counter()
+        decode(*payloads)
+        seconds = time.perf_counter() - start
+        baseline = baseline or seconds
+        print('{:<20} {:>8.1f} ms {:>6.1f}x'.format(
+            name, seconds * 1000, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Micro-benchmark of SearchIndex against the former linear regex scan
+_search and the ranked linear scan used for single queries.
+
+Usage:
+  python benchmarks/bench_search.py [<num_profiles>]
+"""
+import random
+import re
+import string
+import sys
+import timeit
+
+from dmsclient.core.models import Profile
+from dmsclient.core.search import _profile_keys, profile_index, scan
+
+
+QUERIES = ['max must', 'johanna', 'jo*mu', 'stef', 'xyz', 'a']
+
+
+def _search(query, choices, accessor=None):
+    """Former search for matches of query in choices.
+    query.match(choise)
+    Optionally provide an accessor:
+    query.match(accessor(choise))
+    """
+    if query is None:
+        return choices
+
+    regex = re.compile(query.replace("*", ".*").replace(" ", ".*"),
+                       re.IGNORECASE | re.DOTALL)
+    if accessor:
+        def filter_(x): return regex.search(accessor(x)) is not None
+    else:
+        def filter_(x): return regex.search(x) is not None
+
+    result = [c for c in choices if filter_(c)]
+    return result
+
+
+def random_name(rnd, length):
+    return rnd.choice(string.ascii_uppercase) + ''.join(
+        rnd.choice(string.ascii_lowercase) for _ in range(length - 1))
+
+
+def make_profiles(n, seed=0):
+    rnd = random.Random(seed)
+    profiles = [Profile(id=i,
+                        username=random_name(rnd, 8).lower(),
+                        email='',
+                        allowed_buy=True,
+                        first_name=random_name(rnd, rnd.randint(3, 9)),
+                        last_name=random_name(rnd, rnd.randint(4, 12)),
+                        is_staff=False,
+                        is_current=False)
+                for i in range(n)]
+    profiles[n // 2].first_name = 'Max'
+    profiles[n // 2].last_name = 'Mustermann'
+    return profiles
+
+
+def build_name(u):
+    return "{} {} {}".format(u.first_name, u.last_name, u.user_name)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    profiles = make_profiles(n)
+
+    build = timeit.timeit(lambda: profile_index(profiles), number=3) / 3
+    index = profile_index(profiles)
+    print('{} profiles, index build {:.1f} ms'.format(n, build * 1000))
+    print('{:<10} {:>8} {:>12} {:>12} {:>12} {:>8}'.format(
+        'query', 'matches', '_search ms', 'scan ms', 'index ms', 'speedup'))
+    for query in QUERIES:
+        number = 20
+        linear = timeit.timeit(
+            lambda: _search(query, profiles, build_name),
+            number=number) / number
+        scanned = timeit.timeit(
+            lambda: scan(query, profiles, _profile_keys),
+            number=number) / number
+        indexed = timeit.timeit(
+            lambda: index.search(query), number=number) / number
+        assert scan(query, profiles, _profile_keys) == index.search(query)
+        print('{:<10} {:>8} {:>12.3f} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+            query, len(index.search(query)),
+            linear * 1000, scanned * 1000, indexed * 1000,
+            linear / indexed))
+
+
+if __name__ == '__main__':
+    main()
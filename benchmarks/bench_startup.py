@@ -0,0 +1,44 @@
+"""Cold start latency of the dms command line interface.
+
+Compares 'dms --version' with a start that imports all modules the command
+line used to import eagerly.
+
+Usage:
+  python benchmarks/bench_startup.py [<runs>]
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+
+COMMANDS = [
+    ('dms --version', ['-m', 'dmsclient.cli', '--version']),
+    ('dms --help', ['-m', 'dmsclient.cli', '--help']),
+    ('eager imports', ['-c', 'import aiohttp, requests, tabulate, docopt, '
+                             'infi.docopt_completion.docopt_completion, '
+                             'dmsclient.cli']),
+]
+
+
+def run(args, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print('{:<15} {:>10} {:>10}'.format('command', 'median ms', 'min ms'))
+    for name, args in COMMANDS:
+        times = run(args, runs)
+        print('{:<15} {:>10.1f} {:>10.1f}'.format(
+            name, statistics.median(times) * 1000, min(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
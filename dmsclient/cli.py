@@ -1,59 +1,171 @@
 """Drink Management System Client.
 
 Usage:
-  dms show (user|users|orders|products|events|comments)
-  dms show [-d <d>] sales
-  dms (order|buy) [-f] [-n <n>] [-u <u>] <product>...
-  dms comment [-u <u>] <text>...
+  dms show [--refresh] [--timings] [-e <e>] [--format=<f>] [--unsorted]
+           (user|users|orders|products|events|comments)
+  dms show [--refresh] [--timings] [-e <e>] [--format=<f>] [--unsorted]
+           [-d <d>] sales
+  dms stats [--refresh] [--timings] [-e <e>] [-d <d>] [-k <k>]
+  dms (order|buy) [--refresh] [--timings] [-e <e>] [-f] [-n <n>] [-u <u>]
+                  <product>...
+  dms comment [--refresh] [--timings] [-e <e>] [-u <u>] <text>...
+  dms import [--refresh] [--timings] [-e <e>] [-f] <file>
+  dms replay [--timings]
+  dms watch [--timings] [-e <e>] [--orders] [-i <s>]
+  dms shell [--refresh] [--timings] [-e <e>]
+  dms loadtest [-e <e>] [-f] [--rate=<r>] [--duration=<s>] [--sessions=<n>]
+               [--workers=<n>] [--mix=<mix>]
   dms setup completion
   dms (-h | --help)
   dms --version
 
 Options:
   -d <days>, --days=<days>  Number of days to show [default: 1].
+  --duration=<s>            Seconds of the load test [default: 30].
+  -e <e>, --endpoint=<e>    Endpoint names of .dmsrc, comma separated, or
+                            'all'. Several run show and stats on all at once.
   -f, --force               Don't ask for confirmation
+  --format=<f>              Output as table, csv, tsv or jsonl [default: table].
   -h, --help                Show this screen.
+  -i <s>, --interval=<s>    Minimal seconds between polls [default: 2].
+  -k <k>, --top=<k>         Number of top consumers [default: 10].
+  --mix=<mix>               Shares of catalog reads, sale history queries,
+                            sales and orders of the load test
+                            [default: catalog=60,history=25,sale=10,order=5].
   -n <n>, --number=<n>      Number of bottles
+  --orders                  Watch orders too.
+  --rate=<r>                Target requests per second [default: 50].
   -u <user>, --user=<user>  (Partial) user's name. E.g. 'stef' for 'Stefan'
+  --refresh                 Ignore cached products, profiles and events.
+  --sessions=<n>            Concurrent sessions of the load test [default: 20].
+  --timings                 Print timings of requests and stages.
+  --unsorted                Keep the order of the server, don't sort. Sales
+                            are listed oldest first then.
   --version                 Show version.
+  --workers=<n>             Processes of the load test [default: 1].
 """
 import asyncio
+import csv
+import json
 import os
-import re
-import configparser
+import shlex
+import sys
+import aiohttp
 import dmsclient as dms
-from distutils.util import strtobool
 
 from docopt import docopt
-from tabulate import tabulate
-from infi.docopt_completion.docopt_completion import docopt_completion
+from operator import attrgetter
 
 
-def print_users(users):
+metrics = dms.MetricsCollector()
+
+
+def tabulate(table, headers):
+    """tabulate.tabulate, imported only when something is printed"""
+    from tabulate import tabulate
+    return tabulate(table, headers=headers)
+
+
+def strtobool(answer):
+    """Convert a yes/no answer to True or False, ValueError otherwise"""
+    if answer in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    elif answer in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError('Invalid answer {!r}'.format(answer))
+
+
+def print_rows(rows, headers, fmt='table', sort=True, reverse=False):
+    """Print rows as table, or as csv, tsv or jsonl. Unsorted rows in the
+    machine readable formats are written one by one as they are generated.
+    """
+    if sort:
+        rows = sorted(rows, reverse=reverse)
+    if fmt == 'table':
+        print(tabulate(rows, headers=headers))
+        return
+    write = row_writer(fmt, headers)
+    for row in rows:
+        write(row)
+
+
+def row_writer(fmt, headers):
+    """Function writing single rows to stdout as csv, tsv or jsonl"""
+    if fmt == 'jsonl':
+        keys = [h.lower().replace(' ', '_') for h in headers]
+
+        def write(row):
+            sys.stdout.write(json.dumps(dict(zip(keys, row)),
+                                        ensure_ascii=False) + '\n')
+        return write
+    elif fmt in ('csv', 'tsv'):
+        writer = csv.writer(sys.stdout, lineterminator='\n',
+                            delimiter='\t' if fmt == 'tsv' else ',')
+        writer.writerow(headers)
+        return writer.writerow
+    print("Unknown format '{}', use table, csv, tsv or jsonl.".format(fmt))
+    exit(1)
+
+
+def print_users(users, fmt='table', sort=True):
+    if fmt != 'table':
+        print_rows(((u.id, u.first_name, u.last_name, u.user_name,
+                     u.allowed_buy, u.is_current) for u in users),
+                   ['ID', 'First Name', 'Last Name', 'User Name',
+                    'Allowed Buy', 'Current'], fmt, sort)
+        return
     table = ((user.first_name,
               user.last_name,
               "({})".format(user.user_name),
               user.allowed_buy,
               "X" if user.is_current else "")
              for user in users)
-    print(tabulate(sorted(table), headers=['First Name', 'Last Name',
-                                           'User Name', 'Allowed to Buy',
-                                           'Current']))
+    print_rows(table, ['First Name', 'Last Name', 'User Name',
+                       'Allowed to Buy', 'Current'], sort=sort)
+
+
+def _sale_row(se, fmt):
+    if fmt == 'table':
+        return (se.date.strftime('%d.%m.%Y %H:%M'),
+                se.product.name,
+                se.profile.name)
+    return (se.id, se.date.isoformat(), se.product.name, se.profile.name)
 
 
-def print_sale_entries(sale_entries):
-    table = ((se.date.strftime('%d.%m.%Y %H:%M'),
-              se.product.name,
-              se.profile.name)
-             for se in sale_entries)
-    print(tabulate(
-        sorted(
-            table,
-            reverse=True),
-        headers=['Date', 'Product', 'Profile']))
+def _sale_headers(fmt):
+    if fmt == 'table':
+        return ['Date', 'Product', 'Profile']
+    return ['ID', 'Date', 'Product', 'Profile']
 
 
-def print_products(products):
+def print_sale_entries(sale_entries, fmt='table', sort=True):
+    print_rows((_sale_row(se, fmt) for se in sale_entries),
+               _sale_headers(fmt), fmt, sort, reverse=True)
+
+
+async def print_sale_entries_stream(sale_entries, profiles, products,
+                                    fmt='table'):
+    """Print sale entries as they arrive. Column widths are estimated from
+    the catalog, such that no entry has to be buffered.
+    """
+    if fmt != 'table':
+        write = row_writer(fmt, _sale_headers(fmt))
+        async for se in sale_entries:
+            write(_sale_row(se, fmt))
+        return
+
+    widths = (16,
+              max([len('Product')] + [len(p.name) for p in products]),
+              max([len('Profile')] + [len(p.name) for p in profiles]))
+    row = '{:<%d}  {:<%d}  {:<%d}' % widths
+
+    print(row.format('Date', 'Product', 'Profile').rstrip())
+    print('  '.join('-' * w for w in widths))
+    async for se in sale_entries:
+        print(row.format(*_sale_row(se, fmt)).rstrip())
+
+
+def print_products(products, fmt='table', sort=True):
     def make_price(price):
         """ Sometimes the price is not set. Do not fail in this case but return
         Unknown
@@ -62,29 +174,54 @@ def print_products(products):
             return "Unknown"
         else:
             return "{:.2f}€".format(price/100)
+    if fmt != 'table':
+        print_rows(((p.id, p.name, p.quantity, p.price_cent)
+                    for p in products),
+                   ['ID', 'Name', 'Quantity', 'Price Cent'], fmt, sort)
+        return
     table = ((product.name, product.quantity,
               make_price(product.price_cent))
              for product in products)
-    print(tabulate(sorted(table), headers=['Name', 'Quantity', 'Price']))
+    print_rows(table, ['Name', 'Quantity', 'Price'], sort=sort)
 
 
-def print_comments(comments):
+def print_comments(comments, fmt='table', sort=True):
     table = ((comment.profile.name, comment.comment)
              for comment in comments)
-    print(tabulate(sorted(table), headers=['Profile', 'Text']))
+    print_rows(table, ['Profile', 'Text'], fmt, sort)
 
 
-def print_events(events):
+def print_events(events, fmt='table', sort=True):
     table = ((event.name, event.price_group, event.active)
              for event in events)
-    print(tabulate(sorted(table), headers=['Name', 'Price Group', 'Active']))
+    print_rows(table, ['Name', 'Price Group', 'Active'], fmt, sort)
+
+
+def print_endpoint_sale_entries(entries, fmt='table', sort=True):
+    """Print the sale entries of several endpoints, given as dict of
+    endpoint name to entries
+    """
+    print_rows((_sale_row(se, fmt) + (name,)
+                for name, sale_entries in entries.items()
+                for se in sale_entries),
+               _sale_headers(fmt) + ['Endpoint'], fmt, sort, reverse=True)
 
 
-async def show(loop, client, args):
+async def _sale_history(client, days, store=None):
+    """Sales of the last days, from the synced local store if there is one"""
+    if store is None:
+        return await client.sale_history(days)
+    await store.sync(client, days)
+    return store.sales(days)
+
+
+async def show(loop, client, args, store=None):
+    fmt = args['--format']
+    sort = not args['--unsorted']
     if args['user']:
-        print_users([await client.current_profile])
+        print_users([await client.current_profile], fmt)
     elif args['users']:
-        print_users(await client.profiles)
+        print_users(await client.profiles, fmt, sort)
     elif args['orders']:
         orders = loop.create_task(client.orders)
         profiles = loop.create_task(client.profiles)
@@ -93,32 +230,86 @@ async def show(loop, client, args):
             dms.construct_sale_entries(
                 await orders,
                 await profiles,
-                await products))
-    elif args['sales']:
+                await products), fmt, sort)
+    elif args['sales'] and (sort or store is not None):
         days = int(args['--days'])
-        sales = loop.create_task(client.sale_history(days))
+        sales = loop.create_task(_sale_history(client, days, store))
         profiles = loop.create_task(client.profiles)
         products = loop.create_task(client.products)
         print_sale_entries(
             dms.construct_sale_entries(
                 await sales,
                 await profiles,
-                await products))
+                await products), fmt, sort)
+    elif args['sales']:
+        # unsorted, print the sales as they arrive
+        days = int(args['--days'])
+        profiles = loop.create_task(client.profiles)
+        products = loop.create_task(client.products)
+        profiles, products = await profiles, await products
+        await print_sale_entries_stream(
+            dms.iter_sale_entries(
+                client.iter_sale_history(days),
+                profiles,
+                products),
+            profiles,
+            products, fmt)
     elif args['products']:
-        print_products(await client.products)
+        print_products(await client.products, fmt, sort)
     elif args['comments']:
         comments = loop.create_task(client.comments)
         profiles = loop.create_task(client.profiles)
         print_comments(
             dms.construct_comments(
                 await comments,
-                await profiles))
+                await profiles), fmt, sort)
     elif args['events']:
-        print_events(await client.events)
+        print_events(await client.events, fmt, sort)
     else:
         raise NotImplementedError()
 
 
+def print_stats(table, k):
+    def make_price(cent):
+        return "{:.2f}€".format(cent/100)
+
+    # keyed by the objects, ids of several endpoints may collide
+    revenue = dict(dms.revenue_by_product(table))
+    print(tabulate(((p.name, n, make_price(revenue[p]))
+                    for p, n in dms.count_by_product(table)),
+                   headers=['Product', 'Sales', 'Revenue']))
+    print()
+    spent = dict(dms.revenue_by_profile(table))
+    print(tabulate(((p.name, n, make_price(spent[p]))
+                    for p, n in dms.top_consumers(table, k)),
+                   headers=['Profile', 'Sales', 'Spent']))
+    print()
+    print(tabulate(((d.strftime('%d.%m.%Y'), n)
+                    for d, n in dms.daily_histogram(table)),
+                   headers=['Day', 'Sales']))
+    print()
+    print(tabulate(((h, n) for h, n in enumerate(dms.hourly_histogram(table))
+                    if n > 0),
+                   headers=['Hour', 'Sales']))
+    print()
+    print(tabulate(((p.name, p.quantity, "{:.1f}".format(rate),
+                     "{:.1f}".format(left))
+                    for p, rate, left in dms.restock_estimate(table)
+                    if left is not None),
+                   headers=['Product', 'Quantity', 'Sales/Day', 'Days Left']))
+
+
+async def stats(loop, client, args, store=None):
+    days = int(args['--days'])
+    sales = loop.create_task(_sale_history(client, days, store))
+    profiles = loop.create_task(client.profiles)
+    products = loop.create_task(client.products)
+    table = dms.SaleTable.from_sales(await sales,
+                                     await profiles,
+                                     await products)
+    print_stats(table, int(args['--top']))
+
+
 def select_yes_no(question, default_yes=True):
     if default_yes is None:
         question += ' [yes/no] '
@@ -127,7 +318,8 @@ def select_yes_no(question, default_yes=True):
     else:
         question += ' [yes/NO] '
 
-    answer = input(question).strip().lower()
+    with metrics.stage('prompt'):
+        answer = input(question).strip().lower()
     if answer == '' and default_yes is not None:
         return default_yes
     try:
@@ -137,18 +329,21 @@ def select_yes_no(question, default_yes=True):
         exit(1)
 
 
-def select_element(choices, query, accessor=None):
-    if len(choices) > 5:
-        print("Way too many like '{}' found.".format(query))
-        exit(1)
-    elif len(choices) > 1:
+def select_element(choices, query, accessor=None, max_choices=5):
+    """Let the user select one of the ranked choices"""
+    if len(choices) > max_choices:
+        print("{} like '{}' found, showing the best {}."
+              .format(len(choices), query, max_choices))
+        choices = choices[:max_choices]
+    if len(choices) > 1:
         for i, c in enumerate(choices):
             if accessor:
                 print("({}) {}".format(i+1, accessor(c)))
             else:
                 print("({}) {}".format(i+1, c))
-        choice_id = int(input("Please enter a number between 1 and {}: "
-                              .format(len(choices)))) - 1
+        with metrics.stage('prompt'):
+            choice_id = int(input("Please enter a number between 1 and {}: "
+                                  .format(len(choices)))) - 1
         if choice_id < 0 or choice_id >= len(choices):
             print("Out of range, stupid.")
             exit(1)
@@ -160,29 +355,54 @@ def select_element(choices, query, accessor=None):
         exit(1)
 
 
-async def _query_products(client, query, aliases):
+async def _query_products(client, query, aliases, catalog=None):
     try:
         prod_id = int(query)
-        products = [await client.product_by_id(prod_id)]
+        product = catalog and catalog.product_by_id(prod_id)
+        products = [product or await client.product_by_id(prod_id)]
     except ValueError:
-        products = dms.search_product(query, await client.products, aliases)
+        if catalog:
+            products = catalog.search_products(query)
+        else:
+            products = await client.search_products(query, aliases)
 
     return products
 
-async def _query_profiles(client, query):
+
+async def _query_profiles(client, query, catalog=None):
     try:
         if query is None:
-            users = [await client.current_profile]
+            user = catalog and catalog.current_profile
+            users = [user or await client.current_profile]
         else:
             user_id = int(query)
-            users = [await client.profile_by_id(user_id)]
+            user = catalog and catalog.profile_by_id(user_id)
+            users = [user or await client.profile_by_id(user_id)]
     except ValueError:
-        users = dms.search_profile(query, await client.profiles)
+        if catalog:
+            users = catalog.search_profiles(query)
+        else:
+            users = await client.search_profiles(query)
 
     return users
 
 
-async def _general_sale(args, product, profile, upper_type, function):
+def print_batch_results(results, upper_type):
+    for result in results:
+        if result.journaled:
+            print("DMS not reachable, {} journaled for 'dms replay'."
+                  .format(result.journaled))
+        if result.ok:
+            if result.succeeded:
+                print("{} successful.".format(upper_type))
+        else:
+            print("{} failed for {} of {}:".format(
+                upper_type, result.failed, result.failed + result.succeeded))
+            for error in sorted(set(str(e) for e in result.errors)):
+                print("  {}".format(error))
+
+
+async def _general_sale(args, client, product, profile, upper_type, order):
     if args['--number'] is None:
         number = 1
     else:
@@ -200,20 +420,20 @@ async def _general_sale(args, product, profile, upper_type, function):
                               product.name,
                               product.price_cent/100,
                               user_name))):
-        await asyncio.gather(
-            *[function(product.id, profile.id) for _ in range(number)])
-        print("{} successful.".format(upper_type))
+        results = await client.submit_batch(
+            [(product.id, profile.id, number)], order=order)
+        print_batch_results(results, upper_type)
     else:
         print("Bye.")
 
 
-async def order(loop, client, aliases, args):
+async def order(loop, client, aliases, args, catalog=None):
     prod_query = ' '.join(args['<product>'])
     user_query = args['--user']
     products_req = loop.create_task(
-        _query_products(client, prod_query, aliases))
+        _query_products(client, prod_query, aliases, catalog))
     profiles_req = loop.create_task(
-        _query_profiles(client, user_query))
+        _query_profiles(client, user_query, catalog))
 
     products = await products_req
     filtered = [p for p in products if p.quantity > 0]
@@ -231,16 +451,16 @@ async def order(loop, client, aliases, args):
     else:
         user = select_element(users, user_query, lambda x: x.name)
 
-    await _general_sale(args, product, user, 'Order', client.add_order)
+    await _general_sale(args, client, product, user, 'Order', True)
 
 
-async def buy(loop, client, aliases, args):
+async def buy(loop, client, aliases, args, catalog=None):
     prod_query = ' '.join(args['<product>'])
     user_query = args['--user']
     products_req = loop.create_task(
-        _query_products(client, prod_query, aliases))
+        _query_products(client, prod_query, aliases, catalog))
     profiles_req = loop.create_task(
-        _query_profiles(client, user_query))
+        _query_profiles(client, user_query, catalog))
 
     products = await products_req
     if len(products) == 1:
@@ -254,21 +474,207 @@ async def buy(loop, client, aliases, args):
     else:
         user = select_element(users, user_query, lambda x: x.name)
 
-    await _general_sale(args, product, user, 'Buy', client.add_sale)
+    await _general_sale(args, client, product, user, 'Buy', False)
 
 
-async def comment(client, args):
+async def comment(client, args, catalog=None):
     text = ' '.join(args['<text>'])
     user_query = args['--user']
-    users = await _query_profiles(client, user_query)
+    users = await _query_profiles(client, user_query, catalog)
 
     if len(users) == 1:
         user = users[0]
     else:
         user = select_element(users, user_query, lambda x: x.name)
 
-    await client.add_comment(text, user.id)
-    print("Comment successful.")
+    if await client.add_comment(text, user.id):
+        print("Comment successful.")
+    else:
+        print("DMS not reachable, comment journaled for 'dms replay'.")
+
+
+def print_tally(rows):
+    table = ((row.profiles[0].name, row.products[0].name, row.count,
+              "{:.2f}€".format(row.count * (row.products[0].price_cent or 0)
+                               / 100))
+             for row in rows)
+    print(tabulate(table, headers=['Profile', 'Product', 'Count', 'Price']))
+
+
+def print_tally_problems(rows):
+    for row in rows:
+        print("Line {}: {}".format(row.line, row.problem))
+        for matches in (row.profiles, row.products):
+            if matches and len(matches) > 1:
+                print("  could be {}{}".format(
+                    ', '.join(m.name for m in matches[:5]),
+                    ', ...' if len(matches) > 5 else ''))
+
+
+async def import_tally(client, config, args, catalog=None):
+    """Submit the sales of a tally sheet after a single confirmation"""
+    path = args['<file>']
+    fmt = {'.jsonl': 'jsonl', '.json': 'jsonl',
+           '.tsv': 'tsv'}.get(os.path.splitext(path)[1].lower(), 'csv')
+    if catalog is None:
+        catalog = dms.Catalog(config.aliases)
+        await catalog.refresh(client)
+    try:
+        with open(path, newline='') as f:
+            rows = dms.resolve_tally(dms.read_tally(f, fmt), catalog)
+    except OSError as e:
+        print("Can't read {}: {}".format(path, e.strerror))
+        exit(1)
+
+    problems = [row for row in rows if row.problem]
+    rows = [row for row in rows if not row.problem]
+    if problems:
+        print_tally_problems(problems)
+        print()
+    if not rows:
+        print("Nothing to import.")
+        return
+
+    print_tally(rows)
+    question = 'Import {} sales of {} rows{}?'.format(
+        sum(row.count for row in rows), len(rows),
+        ', skipping {} rows'.format(len(problems)) if problems else '')
+    if not (args['--force'] or select_yes_no(question,
+                                             default_yes=not problems)):
+        print("Bye.")
+        return
+
+    results = await client.submit_batch([row.batch_item() for row in rows],
+                                        concurrency=8)
+    succeeded = sum(r.succeeded for r in results)
+    journaled = sum(r.journaled for r in results)
+    print("Imported {} sales.".format(succeeded))
+    if journaled:
+        print("DMS not reachable, {} sales journaled for 'dms replay'."
+              .format(journaled))
+    for row, result in zip(rows, results):
+        if not result.ok:
+            print("Line {}: {} of {} failed: {}".format(
+                row.line, result.failed, row.count,
+                '; '.join(sorted(set(str(e) for e in result.errors)))))
+
+
+async def replay(client):
+    if client.journal is None:
+        print("No journal configured, set 'journal' in [GENERAL].")
+        exit(1)
+    result = await client.replay_journal()
+    print("Replayed {} journaled writes.".format(len(result.sent)))
+    if result.conflicts:
+        print("Rejected by the DMS (kept in {}):"
+              .format(client.journal.conflicts_path))
+        for entry, error in result.conflicts:
+            print("  {} {}: {}".format(entry['kind'], entry['data'], error))
+    if result.remaining:
+        print("DMS not reachable, {} writes remain journaled."
+              .format(len(result.remaining)))
+
+
+async def watch(client, config, args):
+    """Print new sales, and orders if requested, until interrupted"""
+    catalog = dms.Catalog(config.aliases)
+    await catalog.refresh(client)
+    print("Watching for new {}, Ctrl-C to quit."
+          .format('sales and orders' if args['--orders'] else 'sales'))
+    async for kind, entry in client.watch(
+            orders=args['--orders'],
+            min_interval=float(args['--interval'])):
+        profile = catalog.profile_by_id(entry['profile'])
+        product = catalog.product_by_id(entry['product'])
+        if profile is None or product is None:
+            await catalog.refresh(client)
+            profile = catalog.profile_by_id(entry['profile'])
+            product = catalog.product_by_id(entry['product'])
+        print('{}  {:<5}  {}  {}'.format(
+            dms.parse_date(entry['date']).strftime('%d.%m.%Y %H:%M'),
+            kind.capitalize(),
+            product.name if product else entry['product'],
+            profile.name if profile else entry['profile']), flush=True)
+
+
+async def loadtest(client, args):
+    """Stress-test the DMS of client, see dmsclient.loadtest"""
+    from dmsclient.loadtest import format_report, parse_mix, run_load
+    try:
+        mix = parse_mix(args['--mix'])
+    except ValueError as e:
+        print(e)
+        exit(1)
+    rate = float(args['--rate'])
+    duration = float(args['--duration'])
+    writes = ' Sales and orders are real.' if (
+        mix.get('sale') or mix.get('order')) else ''
+    if not (args['--force'] or select_yes_no(
+            'Send {} requests per second for {} s to {}?{}'.format(
+                rate, duration, client.api_endpoint, writes),
+            default_yes=False)):
+        print("Bye.")
+        return
+    result = await run_load(client.token, client.api_endpoint, mix,
+                            rate=rate, duration=duration,
+                            sessions=int(args['--sessions']),
+                            workers=int(args['--workers']))
+    print(format_report(result))
+
+
+async def _replay_in_background(client, interval):
+    """Replay the journal whenever it has entries"""
+    while True:
+        await asyncio.sleep(interval)
+        if len(client.journal) > 0:
+            try:
+                result = await client.replay_journal()
+            except Exception:
+                continue
+            if result.sent or result.conflicts:
+                print("\nReplayed {} journaled writes, {} rejected."
+                      .format(len(result.sent), len(result.conflicts)))
+
+
+async def shell(loop, client, config, store=None, interval=60):
+    """Read and run commands with one session and a warm catalog"""
+    catalog = dms.Catalog(config.aliases)
+    await catalog.refresh(client)
+    tasks = [loop.create_task(catalog.keep_fresh(client, interval))]
+    if client.journal is not None:
+        tasks.append(loop.create_task(
+            _replay_in_background(client, interval)))
+
+    print("Enter commands without 'dms', e.g. 'buy -u max mate'. "
+          "'exit' to quit.")
+    try:
+        while True:
+            try:
+                line = await loop.run_in_executor(None, input, 'dms> ')
+            except EOFError:
+                print()
+                break
+            argv = shlex.split(line)
+            if not argv:
+                continue
+            elif argv[0] in ('exit', 'quit'):
+                break
+            try:
+                args = docopt(__doc__, argv=argv,
+                              version='dmsclient {}'.format(dms.__version__))
+                await run_command(loop, client, config, args,
+                                  catalog, store)
+            except SystemExit as e:
+                # docopt usage errors and aborted commands
+                if isinstance(e.code, str):
+                    print(e.code)
+            except NotImplementedError:
+                print("Not available in the shell.")
+            except Exception as e:
+                print("Failed: {}".format(e))
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 def load_config():
@@ -297,32 +703,243 @@ def load_config():
     return config
 
 
-async def async_main(loop):
-    args = docopt(__doc__, version='dmsclient {}'.format(dms.__version__))
+BASH_COMPLETION = r"""# product and user names for dms, from its cache
+_dms_names() {
+    local cur=${COMP_WORDS[COMP_CWORD]} prev=${COMP_WORDS[COMP_CWORD-1]}
+    if [[ $prev == = ]]; then
+        prev=${COMP_WORDS[COMP_CWORD-2]}
+    fi
+    local IFS=$'\n'
+    case $prev in
+        -u|--user)
+            COMPREPLY=($(dms _complete user "$cur" 2>/dev/null)) ;;
+        *)
+            if [[ ${COMP_WORDS[1]} == @(buy|order) && $cur != -* ]]; then
+                COMPREPLY=($(dms _complete product "$cur" 2>/dev/null))
+            elif declare -F _dms >/dev/null; then
+                _dms "$@"
+            fi ;;
+    esac
+}
+complete -F _dms_names dms
+"""
 
-    if args['setup'] and args['completion']:
-        docopt_completion('dms')
-        print('-> start a new shell to test completion')
-        exit(0)
 
-    config = load_config()
-
-    async with dms.DmsClient(config.token, config.api) as client:
-        if args['show']:
-            await show(loop, client, args)
-        elif args['order']:
-            await order(loop, client, config.aliases, args)
-        elif args['buy']:
-            await buy(loop, client, config.aliases, args)
-        elif args['comment']:
-            await comment(client, args)
-        else:
-            raise NotImplementedError()
+def setup_completion():
+    from infi.docopt_completion.docopt_completion import docopt_completion
+    docopt_completion('dms')
+    path = os.path.expanduser('~/.dms-completion.bash')
+    with open(path, 'w') as f:
+        f.write(BASH_COMPLETION)
+    print('-> for product and user names in bash add to ~/.bashrc:')
+    print('   source {}'.format(path))
+    print('-> start a new shell to test completion')
+
+
+def complete(kind, prefix=''):
+    """Print completions of product or user names, one per line.
+    Answered from the cache, without connecting to the DMS.
+    """
+    config = dms.DmsConfig()
+    if (config.read(os.path.expanduser('~/.dmsrc')) ==
+            dms.ReadStatus.NOT_FOUND or not config.cache_enabled):
+        return
+    client = dms.DmsClient(config.token, config.api,
+                           cache=dms.DmsCache(config.cache_path,
+                                              config.cache_ttl))
+    products, profiles = client.cached_catalog()
+    if kind == 'product':
+        index = dms.product_completions(products, config.aliases)
+    elif kind == 'user':
+        index = dms.profile_completions(profiles)
+    else:
+        return
+    for word in index.complete(prefix):
+        print(word)
+
+
+def endpoint_names(config, option):
+    """Names of the endpoints selected by --endpoint"""
+    endpoints = config.endpoints
+    if option is None:
+        return ['default']
+    elif option == 'all':
+        return [name for name, (token, api) in endpoints.items()
+                if token and api]
+    names = [name.strip() for name in option.split(',')]
+    for name in names:
+        if name not in endpoints or not all(endpoints[name]):
+            print("{0} endpoint '{1}', add a section [ENDPOINT {1}] "
+                  "with api and token to .dmsrc.".format(
+                      'Unknown' if name not in endpoints else 'Incomplete',
+                      name))
+            exit(1)
+    return names
+
+
+def _succeeded(results):
+    """Results of a fan out without the failed endpoints, which are
+    reported on stderr
+    """
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print("Endpoint {} failed: {}".format(name, result),
+                  file=sys.stderr)
+    return type(results)((name, result) for name, result in results.items()
+                         if not isinstance(result, Exception))
+
+
+async def fan_out(config, names, args, cache=None):
+    """Run 'show sales', 'show orders' or 'stats' on several endpoints at
+    once and merge the results
+    """
+    endpoints = config.endpoints
+    async with dms.MultiDmsClient(
+            [(name, endpoints[name]) for name in names],
+            cache=cache,
+            refresh=args['--refresh'],
+            metrics=metrics if args['--timings'] else None) as multi:
+        try:
+            with metrics.stage('command'):
+                days = int(args['--days'])
+                if args['stats']:
+                    tables = _succeeded(await multi.sale_tables(days))
+                    print_stats(dms.SaleTable.concat(tables.values(),
+                                                     key=attrgetter('name')),
+                                int(args['--top']))
+                elif args['show'] and (args['sales'] or args['orders']):
+                    entries = _succeeded(await multi.sale_entries(
+                        days, orders=args['orders']))
+                    print_endpoint_sale_entries(entries, args['--format'],
+                                                not args['--unsorted'])
+                else:
+                    print("Only 'show sales', 'show orders' and 'stats' "
+                          "run on several endpoints.")
+                    exit(1)
+        finally:
+            if args['--timings']:
+                print_timings(metrics, multi.counters)
+
+
+async def async_main(loop, args):
+    with metrics.stage('config'):
+        config = load_config()
+
+    cache = None
+    if config.cache_enabled:
+        cache = dms.DmsCache(config.cache_path, config.cache_ttl)
+
+    names = endpoint_names(config, args['--endpoint'])
+    if len(names) > 1:
+        await fan_out(config, names, args, cache)
+        return
+    token, api = config.endpoints[names[0]]
+
+    # the journal and the store keep data of the default endpoint
+    journal = None
+    if config.journal and names == ['default']:
+        journal = dms.WriteJournal(config.journal)
+
+    store = None
+    if config.store and names == ['default']:
+        store = dms.SalesStore(config.store)
+
+    async with dms.DmsClient(token, api, cache=cache,
+                             journal=journal,
+                             idempotency_keys=(config.idempotency_keys and
+                                               names == ['default']),
+                             refresh=args['--refresh'],
+                             metrics=metrics if args['--timings'] else None
+                             ) as client:
+        try:
+            with metrics.stage('command'):
+                await run_command(loop, client, config, args, store=store)
+        finally:
+            if store is not None:
+                store.close()
+            if args['--timings']:
+                print_timings(metrics, client.counters)
+
+
+async def run_command(loop, client, config, args, catalog=None, store=None):
+    if catalog is not None and args['--endpoint']:
+        # the shell is connected to one endpoint
+        raise NotImplementedError()
+    elif args['show']:
+        await show(loop, client, args, store)
+    elif args['stats']:
+        await stats(loop, client, args, store)
+    elif args['order']:
+        await order(loop, client, config.aliases, args, catalog)
+    elif args['buy']:
+        await buy(loop, client, config.aliases, args, catalog)
+    elif args['comment']:
+        await comment(client, args, catalog)
+    elif args['import']:
+        await import_tally(client, config, args, catalog)
+    elif args['replay']:
+        await replay(client)
+    elif args['watch'] and catalog is None:
+        await watch(client, config, args)
+    elif args['loadtest'] and catalog is None:
+        await loadtest(client, args)
+    elif args['shell'] and catalog is None:
+        await shell(loop, client, config, store)
+    else:
+        raise NotImplementedError()
+
+
+def print_timings(metrics, counters):
+    def ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 1)
+
+    print()
+    print(tabulate(((t.method, t.api, t.status or type(t.error).__name__,
+                     ms(t.dns), ms(t.connect), ms(t.wait), ms(t.receive),
+                     ms(t.total), t.bytes_sent, t.bytes_received,
+                     t.bytes_wire, t.encoding)
+                    for t in metrics.requests),
+                   headers=['Method', 'Api', 'Status', 'DNS ms',
+                            'Connect ms', 'Wait ms', 'Receive ms', 'Total ms',
+                            'Sent B', 'Received B', 'Wire B', 'Encoding']))
+    print()
+    print(tabulate(((name, count, ms(seconds))
+                    for name, (seconds, count) in metrics.stages.items()),
+                   headers=['Stage', 'Count', 'Total ms']))
+    print()
+    print('{} requests sent, {} saved by coalescing, {} by the cache.'
+          .format(counters.sent, counters.coalesced, counters.cached))
+    received = sum(t.bytes_received for t in metrics.requests)
+    wire = sum(t.bytes_wire or t.bytes_received for t in metrics.requests)
+    print('{} bytes received, {} on the wire.'.format(received, wire))
 
 
 def main():
+    if sys.argv[1:2] == ['_complete']:
+        # called by the shell completion on tab, see setup_completion
+        complete(*sys.argv[2:4])
+        exit(0)
+
+    args = docopt(__doc__, version='dmsclient {}'.format(dms.__version__))
+
+    if args['setup'] and args['completion']:
+        setup_completion()
+        exit(0)
+
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(async_main(loop))
+    try:
+        loop.run_until_complete(async_main(loop, args))
+    except KeyboardInterrupt:
+        print()
+        exit(130)
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError,
+            dms.CircuitOpenError) as e:
+        print("DMS not reachable: {}".format(str(e) or type(e).__name__))
+        exit(1)
+    except BrokenPipeError:
+        # the reader of the output, e.g. head, quit early
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        exit(1)
 
 
 if __name__ == "__main__":
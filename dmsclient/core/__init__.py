@@ -1,7 +1,37 @@
+from .batch import *
+from .cache import *
+from .catalog import *
 from .client import *
 from .config import *
+from .decode import *
+from .journal import *
+from .metrics import *
+from .middleware import *
+from .multi import *
+from .search import *
+from .stats import *
+from .stream import *
+from .store import *
+from .sync import *
+from .table import *
+from .tally import *
 from .utility import *
 
-__all__ = (client.__all__ +
+__all__ = (batch.__all__ +
+           cache.__all__ +
+           catalog.__all__ +
+           client.__all__ +
            config.__all__ +
+           decode.__all__ +
+           journal.__all__ +
+           metrics.__all__ +
+           middleware.__all__ +
+           multi.__all__ +
+           search.__all__ +
+           stats.__all__ +
+           stream.__all__ +
+           store.__all__ +
+           sync.__all__ +
+           table.__all__ +
+           tally.__all__ +
            utility.__all__)
@@ -0,0 +1,54 @@
+import asyncio
+
+__all__ = ['BatchItem', 'BatchResult']
+
+
+class BatchItem:
+    """Request to submit count sales or orders of a product for a profile.
+    Without profile_id the current profile is used.
+    """
+    def __init__(self, product_id, profile_id=None, count=1):
+        assert isinstance(product_id, int)
+        assert profile_id is None or isinstance(profile_id, int)
+        assert isinstance(count, int) and count > 0
+        self.product_id = product_id
+        self.profile_id = profile_id
+        self.count = count
+
+
+class BatchResult:
+    """Outcome of a submitted BatchItem. Sales journaled for a later replay
+    count as neither succeeded nor failed.
+    """
+    def __init__(self, item):
+        self.item = item
+        self.succeeded = 0
+        self.journaled = 0
+        self.errors = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    @property
+    def ok(self):
+        return self.failed == 0
+
+
+def is_transient(error):
+    """True if a request failing with error might succeed when repeated"""
+    import aiohttp
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (aiohttp.ClientConnectionError,
+                              asyncio.TimeoutError))
+
+
+def is_unsent(error):
+    """True if a request failing with error surely wasn't processed by the
+    server, because no connection was made or it was rate limited
+    """
+    import aiohttp
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429
+    return isinstance(error, aiohttp.ClientConnectorError)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import time
+
+__all__ = ['DmsCache']
+
+
+DEFAULT_TTL = {
+    '/products/': 60,
+    '/profiles/': 3600,
+    '/profiles/current/': 3600,
+    '/events/': 3600,
+}
+
+# how long marks about a server, e.g. that it ignores filters, are kept
+MARK_TTL = 86400
+
+
+def default_cache_dir():
+    """Cache directory following the XDG base directory convention"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'dmsclient')
+
+
+class DmsCache:
+    """On-disk cache for rarely changing api resources like products,
+    profiles and events.
+
+    Each resource has a time to live in seconds. Within this time the cached
+    copy is used without any request. Afterwards the client revalidates the
+    copy with a conditional request (ETag / Last-Modified).
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path or default_cache_dir()
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+
+    def cacheable(self, api):
+        """True if responses of the api path are stored in the cache"""
+        return api in self.ttl
+
+    def is_fresh(self, entry, api):
+        """True if the entry can be used without revalidation"""
+        return time.time() - entry['fetched'] < self.ttl[api]
+
+    def load(self, key):
+        """Read the entry stored under key. None if missing or unreadable."""
+        try:
+            with open(self._file(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or 'body' not in entry:
+            return None
+        return entry
+
+    def store(self, key, body, etag=None, last_modified=None):
+        """Write a freshly fetched response body and its validators"""
+        entry = {'fetched': time.time(),
+                 'etag': etag,
+                 'last_modified': last_modified,
+                 'body': body}
+        self._write(key, entry)
+        return entry
+
+    def touch(self, key, entry):
+        """Mark an entry as revalidated by the server"""
+        entry['fetched'] = time.time()
+        self._write(key, entry)
+
+    def mark(self, key):
+        """Remember a fact about the server under key for MARK_TTL seconds,
+        e.g. that it ignores filter parameters
+        """
+        self.store(key, True)
+
+    def marked(self, key):
+        """True if key was marked within the last MARK_TTL seconds"""
+        entry = self.load(key)
+        return (entry is not None and entry['body'] is True and
+                time.time() - entry['fetched'] < MARK_TTL)
+
+    def clear(self):
+        """Remove all cached entries"""
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def _file(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.json')
+
+    def _write(self, key, entry):
+        """Write atomically, such that concurrent readers never see
+        partial files. A failing write only costs the cached copy.
+        """
+        path = self._file(key)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from .search import product_index, profile_index
+
+__all__ = ['Catalog']
+
+
+class Catalog:
+    """In-memory snapshot of products and profiles with prebuilt search
+    indices, for long running processes serving many queries.
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases
+        self.updated = None
+        self.update([], [])
+
+    def update(self, products, profiles):
+        """Replace the snapshot and rebuild the indices"""
+        self.products = products
+        self.profiles = profiles
+        self._products = {p.id: p for p in products}
+        self._profiles = {p.id: p for p in profiles}
+        self._product_index = product_index(products, self.aliases)
+        self._profile_index = profile_index(profiles)
+        self.updated = time.time()
+
+    async def refresh(self, client):
+        """Fetch products and profiles in parallel"""
+        products, profiles = await asyncio.gather(client.products,
+                                                  client.profiles)
+        self.update(products, profiles)
+
+    async def keep_fresh(self, client, interval=60, on_error=None):
+        """Refresh the snapshot every interval seconds until cancelled.
+        Failing refreshes keep the old snapshot and call on_error(error).
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(client)
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+
+    def search_products(self, query):
+        return self._product_index.search(query)
+
+    def search_profiles(self, query):
+        return self._profile_index.search(query)
+
+    def product_by_id(self, id):
+        return self._products.get(id)
+
+    def profile_by_id(self, id):
+        return self._profiles.get(id)
+
+    @property
+    def current_profile(self):
+        return next((p for p in self.profiles if p.is_current), None)
@@ -1,34 +1,153 @@
-import aiohttp
 import asyncio
-import requests
+import uuid
 
 from datetime import datetime
+from functools import lru_cache, partial
+from urllib.parse import urlencode
+from .batch import BatchItem, BatchResult, is_transient, is_unsent
+from .decode import json_loads
+from .journal import ReplayResult
+from .metrics import NoMetrics, metrics_trace_config
+from .middleware import CircuitOpenError, Request, default_middlewares
 from .models import Profile, Product, Comment, Event, SaleEntry
+from .search import _fragments, _product_keys, _profile_keys, scan
+from .stream import iter_json_array
 
-__all__ = ['DmsClient']
+__all__ = ['DmsClient', 'RequestCounters', 'create_session']
+
+
+def create_session(limit=100, limit_per_host=8, keepalive_timeout=30,
+                   ttl_dns_cache=300, ssl=None, trace_configs=None):
+    """Create an aiohttp session which can be shared by many DmsClients.
+
+    Connections to a host are limited to limit_per_host and kept alive for
+    keepalive_timeout seconds for reuse. DNS lookups are cached for
+    ttl_dns_cache seconds. Unless ssl is given, all sessions share one
+    default SSL context, such that certificates are loaded only once.
+    For clients with a MetricsCollector add metrics_trace_config() to
+    trace_configs. Responses are requested compressed, with brotli if
+    installed.
+    """
+    import aiohttp  # imported lazily, it dominates the startup time
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        use_dns_cache=ttl_dns_cache is not None,
+        ttl_dns_cache=ttl_dns_cache,
+        ssl=_default_ssl_context() if ssl is None else ssl)
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={'Content-type': 'application/json',
+                 'Accept-Encoding': _accept_encoding()},
+        trace_configs=trace_configs)
+
+
+def _offline(error):
+    """True if a write failed because the DMS is not reachable"""
+    return is_transient(error) or isinstance(error, CircuitOpenError)
+
+
+def _unsent(error):
+    """True if a write failed before it reached the DMS"""
+    return is_unsent(error) or isinstance(error, CircuitOpenError)
+
+
+@lru_cache(maxsize=None)
+def _accept_encoding():
+    """Encodings aiohttp can decode here"""
+    try:
+        import brotli
+        return 'br, gzip, deflate'
+    except ImportError:
+        return 'gzip, deflate'
+
+
+@lru_cache(maxsize=None)
+def _default_ssl_context():
+    import ssl
+    return ssl.create_default_context()
+
+
+class RequestCounters:
+    """Number of requests a DmsClient sent, and how many were saved by
+    sharing in-flight requests (coalesced) or by the cache (cached)
+    """
+    __slots__ = ('sent', 'coalesced', 'cached')
+
+    def __init__(self):
+        self.sent = 0
+        self.coalesced = 0
+        self.cached = 0
+
+    @property
+    def saved(self):
+        return self.coalesced + self.cached
 
 
 class DmsClient:
-    def __init__(self, token, api_endpoint):
+    def __init__(self, token, api_endpoint, cache=None, refresh=False,
+                 session=None, session_options=None, middlewares=None,
+                 metrics=None, journal=None, project_fields=True,
+                 idempotency_keys=False):
+        """Client for the DMS api.
+
+        Optionally provide a DmsCache to keep products, profiles and events
+        on disk. With refresh the cached copies are ignored and fetched anew.
+        Pass a session from create_session to share connections with other
+        clients, otherwise connect creates one with session_options.
+        Requests pass through the middlewares, by default retries, a circuit
+        breaker and a rate limiter. Pass an empty list to disable them.
+        A MetricsCollector as metrics records the timings of all requests.
+        With a WriteJournal, sales, orders and comments are journaled if
+        the DMS is unreachable, see replay_journal.
+        With project_fields, profiles, products and events are requested
+        with only the fields the models use.
+        Set idempotency_keys only if the DMS deduplicates writes by their
+        Idempotency-Key. Then writes carry one, are retried and journaled
+        like GETs on any transient failure, and replays send the journaled
+        key. Otherwise writes are only retried or journaled if they surely
+        didn't reach the DMS.
+        """
         if token and len(token) > 1:
             self.token = token
         else:
             raise ValueError('Please provide a valid token.')
 
         self.api_endpoint = api_endpoint
+        self.cache = cache
+        self.refresh = refresh
+        self.session = session
+        self.session_options = session_options or {}
+        self._owns_session = session is None
+        if middlewares is None:
+            middlewares = default_middlewares(retry_writes=idempotency_keys)
+        self.middlewares = middlewares
+        self._headers = {'Authorization': 'Token ' + self.token}
+        self._inflight = {}
+        self._unfiltered = set()
+        self.counters = RequestCounters()
+        self.metrics = metrics
+        self.journal = journal
+        self.project_fields = project_fields
+        self.idempotency_keys = idempotency_keys
+        self._stages = metrics or NoMetrics()
 
     def connect(self):
-        self.session = aiohttp.ClientSession(
-            headers={
-                'Authorization': 'Token ' + self.token,
-                'Content-type': 'application/json'})
+        if self._owns_session:
+            options = dict(self.session_options)
+            if self.metrics is not None:
+                options['trace_configs'] = (
+                    list(options.get('trace_configs') or []) +
+                    [metrics_trace_config()])
+            self.session = create_session(**options)
 
     def disconnect(self):
         loop = asyncio.get_event_loop()
         loop.run_until_complete(self._disconnect())
 
     async def _disconnect(self):
-        if self.session:
+        if self.session and self._owns_session:
             await self.session.close()
 
     async def __aenter__(self):
@@ -73,66 +192,526 @@ class DmsClient:
             assert isinstance(num_days, int)
         return await self._get('/sales/{}/'.format(num_days))
 
+    async def iter_sale_history(self, num_days=None):
+        """Like sale_history, but yields the sales one by one while the
+        response is still being received.
+        """
+        if num_days is None:
+            num_days = ''
+        else:
+            assert isinstance(num_days, int)
+        _, _, chunks = await self._request(
+            'GET', '/sales/{}/'.format(num_days), stream=True)
+        try:
+            async for sale in iter_json_array(chunks):
+                yield sale
+        finally:
+            await chunks.aclose()
+
+    async def watch(self, orders=False, min_interval=2.0, max_interval=30.0,
+                    backoff=1.5):
+        """Poll for new sales, and orders if requested, until cancelled.
+        Yields tuples (kind, entry) with kind 'sale' or 'order'.
+
+        Polls are conditional GETs if the DMS sends ETags, an unchanged
+        list costs a 304 without body. Only entries with ids above all ids
+        seen before are yielded, none of the first poll. Polls without news stretch the interval
+        by backoff up to max_interval, news reset it to min_interval.
+        While the DMS is unreachable it is polled every max_interval.
+        """
+        feeds = [('sale', '/sales/1/')]
+        if orders:
+            feeds.append(('order', '/orders/'))
+        etags = {}
+        last_ids = {}
+        interval = min_interval
+
+        async def poll(api):
+            headers = None
+            if etags.get(api):
+                headers = {'If-None-Match': etags[api]}
+            status, resp_headers, body = await self._request(
+                'GET', api, headers=headers)
+            if status == 304:
+                return []
+            # without an ETag, news are told apart by their ids only
+            etags[api] = resp_headers.get('ETag')
+            if api not in last_ids:
+                last_ids[api] = max((e['id'] for e in body), default=0)
+                return []
+            new = sorted((e for e in body if e['id'] > last_ids[api]),
+                         key=lambda e: e['id'])
+            if new:
+                last_ids[api] = new[-1]['id']
+            return new
+
+        while True:
+            try:
+                polled = await asyncio.gather(*[poll(api)
+                                                for _, api in feeds])
+            except Exception as e:
+                if not _offline(e):
+                    raise
+                interval = max_interval
+            else:
+                if any(polled):
+                    interval = min_interval
+                else:
+                    interval = min(interval * backoff, max_interval)
+                for (kind, _), new in zip(feeds, polled):
+                    for entry in new:
+                        yield kind, entry
+            await asyncio.sleep(interval)
+
     async def profile_by_id(self, id):
         assert isinstance(id, int) or id == 'current'
-        return await self._get('/profiles/{}/'.format(id), Profile)
+        return await self._by_id('/profiles/', Profile, id)
 
     async def product_by_id(self, id):
         assert isinstance(id, int)
-        return await self._get('/products/{}/'.format(id), Product)
+        return await self._by_id('/products/', Product, id)
+
+    async def _by_id(self, api, constructor, id):
+        """GET a single item of api. While the DMS is unreachable, it is
+        looked up in the cached list of api instead, regardless of its age.
+        """
+        try:
+            return await self._get('{}{}/'.format(api, id), constructor)
+        except Exception as e:
+            if not _offline(e) or self.cache is None:
+                raise
+            entry = self.cache.load(self._cache_key(api))
+            if entry is not None:
+                for d in entry['body']:
+                    if (d.get('is_current') if id == 'current'
+                            else d['id'] == id):
+                        return constructor.from_api(d)
+            raise
+
+    async def search_products(self, query, aliases=None, displayed=None,
+                              in_stock=False):
+        """Products matching query, best match first, see product_index.
+        Optionally only displayed (or hidden) products, or those in stock.
+        """
+        def keep(p):
+            return ((displayed is None or p.displayed == displayed) and
+                    (not in_stock or p.quantity > 0))
+
+        params = {}
+        if displayed is not None:
+            params['displayed'] = 'true' if displayed else 'false'
+        if in_stock:
+            params['quantity__gt'] = 0
+        if query and aliases and scan(query, [a for a, _ in aliases]):
+            # aliases are only known locally
+            products = [p for p in await self.products if keep(p)]
+        else:
+            products = await self._filtered('/products/', Product, query,
+                                            params, keep, lambda p: p.name)
+        return scan(query, products, _product_keys(aliases))
+
+    async def search_profiles(self, query):
+        """Profiles allowed to buy matching query, best match first, see
+        profile_index
+        """
+        def keep(p):
+            return p.allowed_buy
+
+        profiles = await self._filtered(
+            '/profiles/', Profile, query, {'allowed_buy': 'true'}, keep,
+            lambda p: ' '.join((p.first_name, p.last_name, p.user_name)))
+        return scan(query, profiles, _profile_keys)
+
+    async def _filtered(self, api, constructor, query, params, keep, key):
+        """Candidates for a search of query in api, with keep(item) true.
+
+        Query and filters are sent to the api as search and filter
+        parameters, such that only candidates are transferred. Servers
+        which reject them or answer with items not matching, i.e. ignoring
+        them, get the full list requested from then on, which is cached.
+        This is remembered in the cache across runs. A cached full list
+        is used or revalidated instead of filtering as well.
+        """
+        fragments = _fragments(query) if query else []
+        if (not (fragments or params) or self._ignores_filters(api) or
+                self._cached(api)):
+            return [i for i in await self._get(api, constructor) if keep(i)]
+
+        params = dict(params)
+        if fragments:
+            params['search'] = ' '.join(fragments)
+        try:
+            items = await self._get(
+                '{}?{}'.format(api, urlencode(sorted(params.items()))),
+                constructor)
+        except Exception as e:
+            if getattr(e, 'status', None) not in (400, 404):
+                raise
+            self._mark_unfiltered(api)
+            return [i for i in await self._get(api, constructor) if keep(i)]
+
+        if not all(keep(i) and all(f in key(i).lower() for f in fragments)
+                   for i in items):
+            self._mark_unfiltered(api)
+        return [i for i in items if keep(i)]
+
+    def _ignores_filters(self, api):
+        """True if the server was found to ignore filters of api"""
+        if api in self._unfiltered:
+            return True
+        return (self.cache is not None and not self.refresh and
+                self.cache.marked(self._cache_key(api) + ' unfiltered'))
+
+    def _mark_unfiltered(self, api):
+        self._unfiltered.add(api)
+        if self.cache is not None:
+            self.cache.mark(self._cache_key(api) + ' unfiltered')
+
+    def cached_catalog(self):
+        """Products and profiles from the cache regardless of their age,
+        empty if not cached. Never connects to the DMS.
+        """
+        catalog = []
+        for api, constructor in (('/products/', Product),
+                                 ('/profiles/', Profile)):
+            entry = None
+            if self.cache is not None:
+                entry = self.cache.load(self._cache_key(api))
+            catalog.append([] if entry is None else
+                           [constructor.from_api(d) for d in entry['body']])
+        return tuple(catalog)
+
+    def _cached(self, api):
+        """True if a response of api is in the cache, fresh or to be
+        revalidated
+        """
+        if self.cache is None or self.refresh or not self.cache.cacheable(api):
+            return False
+        return self.cache.load(self._cache_key(api)) is not None
+
+    def _cache_key(self, api):
+        return '{} {}'.format(self.token, self.api_endpoint + api)
 
     async def add_order(self, product_id, profile_id=None):
         assert isinstance(product_id, int)
         if profile_id is None:
-            profile_id = await self.current_profile.id
+            profile_id = (await self.current_profile).id
         else:
             assert isinstance(profile_id, int)
 
-        return await self._post(
-            '/orders/',
+        return await self._write(
+            'order', '/orders/',
             {"profile": profile_id, "product": product_id})
 
     async def add_sale(self, product_id, profile_id=None):
         assert isinstance(product_id, int)
         if profile_id is None:
-            profile_id = await self.current_profile.id
+            profile_id = (await self.current_profile).id
         else:
             assert isinstance(profile_id, int)
 
-        return await self._post(
-            '/sales/',
+        return await self._write(
+            'sale', '/sales/',
             {"profile": profile_id, "product": product_id})
 
     async def add_comment(self, comment, profile_id=None):
         assert isinstance(comment, str)
         if profile_id is None:
-            profile_id = await self.current_profile.id
+            profile_id = (await self.current_profile).id
         else:
             assert isinstance(profile_id, int)
 
-        return await self._post(
-            '/comments/',
+        return await self._write(
+            'comment', '/comments/',
             {"profile": profile_id, "comment": comment})
 
+    async def submit_batch(self, items, order=False, concurrency=4):
+        """Submit many sales (or orders) with bounded concurrency.
+
+        items are BatchItems or tuples (product_id, profile_id, count).
+        Retries are left to the middlewares, see idempotency_keys.
+        Returns one BatchResult per item. With a journal, sales failing due
+        to connectivity are journaled.
+        """
+        kind = 'order' if order else 'sale'
+        api = '/orders/' if order else '/sales/'
+        results = [BatchResult(i if isinstance(i, BatchItem) else BatchItem(*i))
+                   for i in items]
+        current_id = None
+        if any(r.item.profile_id is None for r in results):
+            current_id = (await self.current_profile).id
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def submit(result):
+            profile_id = result.item.profile_id
+            if profile_id is None:
+                profile_id = current_id
+            data = {"profile": profile_id, "product": result.item.product_id}
+            key = str(uuid.uuid4())
+            try:
+                async with semaphore:
+                    await self._request('POST', api, data=data,
+                                        headers=self._write_headers(key))
+            except Exception as e:
+                if self.journal is not None and self._retry_later(e):
+                    self.journal.append(kind, data, key)
+                    result.journaled += 1
+                else:
+                    result.errors.append(e)
+                return
+            result.succeeded += 1
+
+        await asyncio.gather(*[submit(r) for r in results
+                               for _ in range(r.item.count)])
+        return results
+
+    async def replay_journal(self, concurrency=4, batch_size=20):
+        """Send the journaled writes in concurrent batches.
+
+        Sent entries are removed from the journal after every batch.
+        Entries rejected by the server, e.g. sales of sold out products,
+        are moved to the conflicts file of the journal. Entries still failing
+        due to connectivity stay in the journal. Without idempotency_keys,
+        entries which may have reached the DMS count as conflicts, as
+        sending them again could duplicate them.
+        """
+        result = ReplayResult()
+        apis = {'sale': '/sales/', 'order': '/orders/',
+                'comment': '/comments/'}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(entry):
+            async with semaphore:
+                try:
+                    await self._request(
+                        'POST', apis[entry['kind']], data=entry['data'],
+                        headers=self._write_headers(entry['key']))
+                except Exception as e:
+                    if self._retry_later(e):
+                        result.remaining.append(entry)
+                    else:
+                        result.conflicts.append((entry, e))
+                    return False
+                result.sent.append(entry)
+                return True
+
+        entries = self.journal.entries()
+        for i in range(0, len(entries), batch_size):
+            batch = entries[i:i + batch_size]
+            conflicts = len(result.conflicts)
+            sent = await asyncio.gather(*[send(e) for e in batch])
+            self.journal.remove(
+                [e['key'] for e, ok in zip(batch, sent) if ok],
+                result.conflicts[conflicts:])
+            if not any(sent) and result.remaining:
+                # still offline, keep the rest for later
+                result.remaining.extend(entries[i + batch_size:])
+                break
+        return result
+
+    async def _write(self, kind, api, data):
+        """Post a sale, order or comment. Returns False if the DMS is not
+        reachable and the write was journaled instead.
+        """
+        key = str(uuid.uuid4())
+        try:
+            await self._request('POST', api, data=data,
+                                headers=self._write_headers(key))
+        except Exception as e:
+            if self.journal is None or not self._retry_later(e):
+                raise
+            self.journal.append(kind, data, key)
+            return False
+        return True
+
+    def _write_headers(self, key):
+        """Headers of a write with the idempotency key key"""
+        if self.idempotency_keys:
+            return {'Idempotency-Key': key}
+        return None
+
+    def _retry_later(self, error):
+        """True if a write failing with error can be sent again later
+        without the risk of duplicating it
+        """
+        if self.idempotency_keys:
+            return _offline(error)
+        return _unsent(error)
+
     async def add_event(self, name, price_group, is_active):
-        return self._post(
+        return await self._post(
             '/events/',
             {"name": name,
              "price_group": price_group,
              "active": is_active})
 
     async def _get(self, api, constructor=None):
-        async with self.session.get(self.api_endpoint + api) as r:
-            if not r.raise_for_status():
-                dicts = await r.json()
-                if constructor is None:
-                    return dicts
-                else:
-                    if isinstance(dicts, dict):
-                        return constructor(**dicts)
-                    else:
-                        return [constructor(**d) for d in dicts]
+        """Concurrent identical GETs share one request and its result.
+        Don't modify the returned objects in place.
+        """
+        key = (api, constructor)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(api, constructor))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None))
+        else:
+            self.counters.coalesced += 1
+        return await asyncio.shield(future)
+
+    async def _fetch(self, api, constructor=None):
+        dicts = await self._get_json(
+            api, getattr(constructor, 'api_fields', None))
+        if constructor is None:
+            return dicts
+        with self._stages.stage('models'):
+            if isinstance(dicts, dict):
+                return constructor.from_api(dicts)
+            else:
+                return [constructor.from_api(d) for d in dicts]
+
+    async def _get_json(self, api, fields=None):
+        """GET api, from the cache if possible. With fields only those are
+        requested, see project_fields. While the DMS is unreachable, a
+        cached copy is used regardless of its age.
+        """
+        if self.cache is None or not self.cache.cacheable(api):
+            _, _, body = await self._get_fields(api, fields)
+            return body
+
+        key = self._cache_key(api)
+        entry = None if self.refresh else self.cache.load(key)
+        if entry is not None and self.cache.is_fresh(entry, api):
+            self.counters.cached += 1
+            return entry['body']
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            status, resp_headers, body = await self._get_fields(api, fields,
+                                                                headers)
+        except Exception as e:
+            if entry is None or not _offline(e):
+                raise
+            # while the DMS is unreachable, a stale copy beats none
+            return entry['body']
+        if status == 304 and entry is not None:
+            self.cache.touch(key, entry)
+            return entry['body']
+
+        self.cache.store(key, body,
+                         etag=resp_headers.get('ETag'),
+                         last_modified=resp_headers.get('Last-Modified'))
+        return body
+
+    async def _get_fields(self, api, fields, headers=None):
+        """GET only the fields of api, if the server doesn't reject the
+        parameter. Servers without field selection ignore it.
+        Projection is turned off only if the request succeeds without the
+        parameter, a 400 may as well be due to other parameters of api.
+        """
+        if not fields or not self.project_fields:
+            return await self._request('GET', api, headers=headers)
+        try:
+            return await self._request('GET', api, headers=headers,
+                                       params={'fields': ','.join(fields)})
+        except Exception as e:
+            if getattr(e, 'status', None) != 400:
+                raise
+        result = await self._request('GET', api, headers=headers)
+        self.project_fields = False
+        return result
 
     async def _post(self, api, data):
-        async with self.session.post(self.api_endpoint + api, json=data) as r:
+        await self._request('POST', api, data=data)
+
+    async def _request(self, method, api, data=None, headers=None,
+                       params=None, stream=False):
+        """Send a request to the api through the middlewares.
+        Returns status, response headers and the decoded json body of GETs.
+        With stream, the body is an async generator of byte chunks, which
+        has to be closed.
+        """
+        handler = self._send
+        for middleware in reversed(self.middlewares):
+            handler = partial(middleware, handler=handler)
+        return await handler(Request(method, api, data, headers, params,
+                                     stream))
+
+    async def _send(self, request):
+        self.counters.sent += 1
+        if request.headers:
+            headers = dict(self._headers, **request.headers)
+        else:
+            headers = self._headers
+        timing = None
+        if self.metrics is not None:
+            timing = self.metrics.begin(request.method, request.api)
+        url = self.api_endpoint + request.api
+        if request.params:
+            url += ('&' if '?' in url else '?') + urlencode(request.params)
+        if request.stream:
+            return await self._send_stream(request, url, headers, timing)
+        status = error = None
+        try:
+            async with self.session.request(request.method, url,
+                                            json=request.data,
+                                            headers=headers,
+                                            trace_request_ctx=timing) as r:
+                status = r.status
+                r.raise_for_status()
+                body = None
+                if request.method == 'GET' and r.status != 304:
+                    body = await r.read()
+                    with self._stages.stage('decode'):
+                        body = json_loads(body)
+                return r.status, r.headers, body
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if timing is not None:
+                self.metrics.finish(timing, status, error)
+
+    async def _send_stream(self, request, url, headers, timing):
+        """Open the response of request, its body is left to _chunks"""
+        try:
+            r = await self.session.request(request.method, url,
+                                           json=request.data,
+                                           headers=headers,
+                                           trace_request_ctx=timing)
+        except Exception as e:
+            if timing is not None:
+                self.metrics.finish(timing, None, e)
+            raise
+        try:
             r.raise_for_status()
+        except Exception as e:
+            r.release()
+            if timing is not None:
+                self.metrics.finish(timing, r.status, e)
+            raise
+        return r.status, r.headers, self._chunks(r, timing)
+
+    async def _chunks(self, response, timing):
+        """Chunks of the body of an open response. Releases the response
+        and finishes its timing at the end.
+        """
+        error = None
+        try:
+            async for chunk in response.content.iter_chunked(2**16):
+                if timing is not None:
+                    timing.bytes_received += len(chunk)
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            response.release()
+            if timing is not None:
+                self.metrics.finish(timing, response.status, error)
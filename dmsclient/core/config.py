@@ -1,5 +1,6 @@
 import os
 
+from collections import OrderedDict
 from configparser import ConfigParser
 from enum import Enum
 
@@ -16,9 +17,14 @@ class ReadStatus(Enum):
 class Sec(Enum):
     """Available config sections"""
     ALIASES = 'ALIASES'
+    CACHE = 'CACHE'
     GENERAL = 'GENERAL'
 
 
+# sections of named endpoints, e.g. [ENDPOINT cafe]
+_ENDPOINT = 'ENDPOINT '
+
+
 class DmsConfig():
 
     def __init__(self):
@@ -28,11 +34,21 @@ class DmsConfig():
         self._add_section(Sec.GENERAL)
         self._set(Sec.GENERAL, 'api', 'https://dms.fachschaft.tf/api')
         self._set(Sec.GENERAL, 'token', '')
+        self._set(Sec.GENERAL, 'journal', '')
+        self._set(Sec.GENERAL, 'store', '')
+        self._set(Sec.GENERAL, 'idempotency_keys', 'no')
         self._set(Sec.GENERAL, 'version', '1')
 
         self._add_section(Sec.ALIASES)
         self._set(Sec.ALIASES, 'wasser', 'Prinzen Perle')
 
+        self._add_section(Sec.CACHE)
+        self._set(Sec.CACHE, 'enabled', 'yes')
+        self._set(Sec.CACHE, 'path', '')
+        self._set(Sec.CACHE, 'products', '60')
+        self._set(Sec.CACHE, 'profiles', '3600')
+        self._set(Sec.CACHE, 'events', '3600')
+
     def read(self, path):
         """Read given config. If config is an older config version it is migrated
         and can later be updated with write()
@@ -72,11 +88,72 @@ class DmsConfig():
         """Access token for the drink management system"""
         return self._get(Sec.GENERAL, 'token')
 
+    @property
+    def endpoints(self):
+        """Named endpoints as OrderedDict of name to (token, api).
+        The endpoint of [GENERAL] is named 'default', others are read from
+        sections [ENDPOINT name] with an api and a token each. A missing
+        api or token is empty.
+        """
+        endpoints = OrderedDict([('default', (self.token, self.api))])
+        for section in self._p.sections():
+            if section.startswith(_ENDPOINT):
+                endpoints[section[len(_ENDPOINT):].strip()] = (
+                    self._p.get(section, 'token', fallback=''),
+                    self._p.get(section, 'api', fallback=''))
+        return endpoints
+
+    def set_endpoint(self, name, api, token):
+        """Add or change the named endpoint"""
+        section = _ENDPOINT + name
+        if not self._p.has_section(section):
+            self._p.add_section(section)
+        self._p.set(section, 'api', api)
+        self._p.set(section, 'token', token)
+
+    @property
+    def journal(self):
+        """Path of the offline write journal. None if journaling is off."""
+        path = self._get(Sec.GENERAL, 'journal')
+        return os.path.expanduser(path) if path else None
+
+    @property
+    def store(self):
+        """Path of the local sales database. None if sales aren't stored."""
+        path = self._get(Sec.GENERAL, 'store')
+        return os.path.expanduser(path) if path else None
+
+    @property
+    def idempotency_keys(self):
+        """Whether the DMS deduplicates writes by their Idempotency-Key"""
+        return self._p.getboolean(Sec.GENERAL.name, 'idempotency_keys')
+
     @property
     def aliases(self):
         """List of aliases. Alias = (lowercase alias, mapped drink)"""
         return [(x.lower(), y) for (x, y) in self._items(Sec.ALIASES)]
 
+    @property
+    def cache_enabled(self):
+        """Whether catalog resources are cached on disk"""
+        return self._p.getboolean(Sec.CACHE.name, 'enabled')
+
+    @property
+    def cache_path(self):
+        """Directory of the on-disk cache. None for the default location."""
+        path = self._get(Sec.CACHE, 'path')
+        return os.path.expanduser(path) if path else None
+
+    @property
+    def cache_ttl(self):
+        """Time to live in seconds per cached api resource. The current
+        profile lives as long as the profiles.
+        """
+        ttl = {'/{}/'.format(name): self._p.getint(Sec.CACHE.name, name)
+               for name in ('products', 'profiles', 'events')}
+        ttl['/profiles/current/'] = ttl['/profiles/']
+        return ttl
+
     def _add_section(self, sec):
         """Wrapper for Configparser.add_section allowing Enum Sec as "sec"."""
         return self._p.add_section(sec.name)
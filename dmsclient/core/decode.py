@@ -0,0 +1,48 @@
+import json
+
+from datetime import datetime
+
+__all__ = ['json_loads', 'parse_date']
+
+
+# name of the json backend json_loads uses
+JSON_BACKEND = 'orjson'
+
+try:
+    import orjson
+
+    def json_loads(data):
+        """Decode json with the fastest installed backend"""
+        return orjson.loads(data)
+except ImportError:
+    JSON_BACKEND = 'ujson'
+    try:
+        import ujson
+
+        def json_loads(data):
+            """Decode json with the fastest installed backend"""
+            return ujson.loads(data)
+    except ImportError:
+        JSON_BACKEND = 'json'
+
+        def json_loads(data):
+            """Decode json with the fastest installed backend"""
+            return json.loads(data)
+
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def parse_date(text):
+    """Parse the ISO timestamps of the api, e.g. 2018-04-01T12:30:59.123456.
+    Several times faster than datetime.strptime.
+    """
+    try:
+        return _fromisoformat(text)
+    except ValueError:
+        return datetime.strptime(text, DATE_FORMAT)
+
+
+# python < 3.7 lacks fromisoformat
+_fromisoformat = getattr(datetime, 'fromisoformat', None) or (
+    lambda text: datetime.strptime(text, DATE_FORMAT))
@@ -0,0 +1,112 @@
+import json
+import os
+import time
+import uuid
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+__all__ = ['WriteJournal', 'ReplayResult']
+
+
+class WriteJournal:
+    """Append-only journal of sales, orders and comments which couldn't be
+    sent to the DMS, for a later replay.
+
+    Entries are json lines, each with a unique key which is sent as
+    Idempotency-Key on replay if the DmsClient has idempotency_keys. Every
+    append is flushed to disk before it returns, a line torn by a crash is
+    skipped on reading. Entries the server rejected on replay are moved to
+    a conflicts file next to the journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conflicts_path = path + '.conflicts'
+
+    def append(self, kind, data, key=None):
+        """Journal a write of kind 'sale', 'order' or 'comment'"""
+        entry = {'key': key or str(uuid.uuid4()),
+                 'kind': kind,
+                 'data': data,
+                 'time': time.time()}
+        with self._lock():
+            _append_line(self.path, entry)
+        return entry
+
+    def entries(self):
+        """Journaled entries in order, without duplicates"""
+        entries = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries.setdefault(entry['key'], entry)
+        except FileNotFoundError:
+            pass
+        return list(entries.values())
+
+    def remove(self, keys, conflicts=()):
+        """Remove replayed entries. Entries in conflicts, tuples of
+        (entry, reason), are kept in the conflicts file.
+        """
+        keys = set(keys)
+        with self._lock():
+            for entry, reason in conflicts:
+                _append_line(self.conflicts_path,
+                             dict(entry, reason=str(reason)))
+                keys.add(entry['key'])
+            remaining = [e for e in self.entries() if e['key'] not in keys]
+            tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(tmp, 'w') as f:
+                for entry in remaining:
+                    f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+    def __len__(self):
+        return len(self.entries())
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive lock against concurrent appends and rewrites"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class ReplayResult:
+    """Outcome of DmsClient.replay_journal"""
+    def __init__(self):
+        self.sent = []
+        self.conflicts = []
+        self.remaining = []
+
+
+def _append_line(path, entry):
+    line = (json.dumps(entry) + '\n').encode('utf-8')
+    with open(path, 'ab+') as f:
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                line = b'\n' + line  # terminate a line torn by a crash
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,162 @@
+import time
+
+from contextlib import contextmanager
+
+__all__ = ['RequestTiming', 'MetricsCollector', 'metrics_trace_config']
+
+
+class RequestTiming:
+    """Phases of a single request in seconds. Phases which didn't happen,
+    e.g. dns and connect for reused connections, are None.
+    bytes_received counts the decoded response body, see bytes_wire.
+    """
+    __slots__ = ('method', 'api', 'status', 'error', 'start', 'end',
+                 'dns', 'connect', 'wait', 'receive',
+                 'bytes_sent', 'bytes_received', 'encoding',
+                 '_content_length', '_mark')
+
+    def __init__(self, method, api):
+        self.method = method
+        self.api = api
+        self.status = None
+        self.error = None
+        self.start = time.perf_counter()
+        self.end = None
+        self.dns = None
+        self.connect = None
+        self.wait = None
+        self.receive = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.encoding = None
+        self._content_length = None
+        self._mark = self.start
+
+    @property
+    def total(self):
+        return None if self.end is None else self.end - self.start
+
+    @property
+    def bytes_wire(self):
+        """Response body bytes as transferred, compressed with encoding if
+        set. None if unknown, for compressed responses without length.
+        """
+        if self.encoding is None:
+            return self.bytes_received
+        return self._content_length
+
+    def _lap(self):
+        now = time.perf_counter()
+        lap, self._mark = now - self._mark, now
+        return lap
+
+
+class MetricsCollector:
+    """Collects per request timings of a DmsClient and durations of
+    pipeline stages. callback(timing) is called after every request.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.requests = []
+        self.stages = {}
+
+    def begin(self, method, api):
+        timing = RequestTiming(method, api)
+        self.requests.append(timing)
+        return timing
+
+    def finish(self, timing, status=None, error=None):
+        timing.end = time.perf_counter()
+        if timing.wait is not None and timing.receive is None:
+            timing.receive = timing._lap()
+        timing.status = status
+        timing.error = error
+        if self.callback is not None:
+            self.callback(timing)
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the duration of a stage, repeated stages are summed up"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds, count = self.stages.get(name, (0, 0))
+            self.stages[name] = (seconds + time.perf_counter() - start,
+                                 count + 1)
+
+
+class NoMetrics:
+    """Stand-in for a missing MetricsCollector, measuring nothing"""
+
+    def stage(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def metrics_trace_config():
+    """aiohttp TraceConfig filling the RequestTiming passed as
+    trace_request_ctx of a request. Add it to sessions shared by clients
+    with a MetricsCollector.
+    """
+    import aiohttp
+    config = aiohttp.TraceConfig()
+
+    def hook(func):
+        async def on_signal(session, context, params):
+            timing = context.trace_request_ctx
+            if isinstance(timing, RequestTiming):
+                func(timing, params)
+        return on_signal
+
+    @hook
+    def on_request_start(timing, params):
+        timing._lap()
+
+    @hook
+    def on_dns_resolvehost_end(timing, params):
+        timing.dns = timing._lap()
+
+    @hook
+    def on_dns_cache_hit(timing, params):
+        timing.dns = timing._lap()
+
+    @hook
+    def on_connection_create_end(timing, params):
+        timing.connect = timing._lap()
+
+    @hook
+    def on_connection_reuseconn(timing, params):
+        timing._lap()
+
+    @hook
+    def on_request_chunk_sent(timing, params):
+        timing.bytes_sent += len(params.chunk)
+
+    @hook
+    def on_request_end(timing, params):
+        timing.wait = timing._lap()
+        headers = params.response.headers
+        timing.encoding = headers.get('Content-Encoding')
+        if 'Content-Length' in headers:
+            timing._content_length = int(headers['Content-Length'])
+
+    @hook
+    def on_response_chunk_received(timing, params):
+        timing.bytes_received += len(params.chunk)
+
+    config.on_request_start.append(on_request_start)
+    config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    config.on_dns_cache_hit.append(on_dns_cache_hit)
+    config.on_connection_create_end.append(on_connection_create_end)
+    config.on_connection_reuseconn.append(on_connection_reuseconn)
+    config.on_request_chunk_sent.append(on_request_chunk_sent)
+    config.on_request_end.append(on_request_end)
+    config.on_response_chunk_received.append(on_response_chunk_received)
+    return config
@@ -0,0 +1,176 @@
+import asyncio
+import random
+import time
+
+from email.utils import parsedate_to_datetime
+from .batch import is_transient, is_unsent
+
+__all__ = [
+    'Request', 'Retry', 'RateLimiter', 'CircuitBreaker', 'CircuitOpenError',
+    'default_middlewares']
+
+
+class Request:
+    """Api request passed through the middlewares of a DmsClient.
+    The body of a stream request is returned unread, as async iterable
+    of chunks. Middlewares see it fail only until the response started.
+    """
+    __slots__ = ('method', 'api', 'data', 'headers', 'params', 'stream')
+
+    def __init__(self, method, api, data=None, headers=None, params=None,
+                 stream=False):
+        self.method = method
+        self.api = api
+        self.data = data
+        self.headers = headers or {}
+        self.params = params
+        self.stream = stream
+
+    @property
+    def idempotent(self):
+        """True if the request may be sent again without side effects"""
+        return self.method == 'GET'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending requests while the server seems down"""
+
+
+def default_middlewares(retry_writes=False):
+    """Middlewares of a DmsClient if none are given"""
+    return [Retry(retry_writes=retry_writes), CircuitBreaker(), RateLimiter()]
+
+
+class Retry:
+    """Repeat GETs failing transiently, with exponential backoff and full
+    jitter. A 429 Retry-After is waited for at least.
+
+    Writes are only repeated if they surely didn't reach the server, as a
+    timeout or a 502 may follow a committed sale. Only for servers which
+    deduplicate writes with an Idempotency-Key, retry_writes repeats those
+    carrying one like GETs.
+    """
+
+    def __init__(self, retries=3, base_delay=0.2, max_delay=5.0,
+                 retry_writes=False):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_writes = retry_writes
+
+    async def __call__(self, request, handler):
+        for attempt in range(self.retries + 1):
+            try:
+                return await handler(request)
+            except Exception as e:
+                if attempt == self.retries or not self._retryable(request, e):
+                    raise
+                delay = random.uniform(
+                    0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                await asyncio.sleep(max(delay, _retry_after(e) or 0))
+
+    def _retryable(self, request, error):
+        if request.idempotent or (self.retry_writes and
+                                  'Idempotency-Key' in request.headers):
+            return is_transient(error)
+        return is_unsent(error)
+
+
+class RateLimiter:
+    """Client side token bucket allowing rate requests per second with
+    bursts up to burst requests. After a 429 response all requests wait
+    for the Retry-After time of the server.
+    """
+
+    def __init__(self, rate=20.0, burst=20):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._blocked_until = 0
+
+    async def __call__(self, request, handler):
+        await self._acquire()
+        try:
+            return await handler(request)
+        except Exception as e:
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until,
+                                          time.monotonic() + retry_after)
+            raise
+
+    async def _acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Fail fast with CircuitOpenError after failure_threshold transient
+    failures in a row. After reset_timeout seconds a single request probes
+    whether the server is back.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+
+    @property
+    def open(self):
+        return self._opened is not None
+
+    async def __call__(self, request, handler):
+        probe = False
+        if self._opened is not None:
+            if (self._probing or
+                    time.monotonic() - self._opened < self.reset_timeout):
+                raise CircuitOpenError(
+                    'DMS unavailable, not sending {} {}'.format(
+                        request.method, request.api))
+            probe = self._probing = True
+
+        try:
+            result = await handler(request)
+        except Exception as e:
+            if is_transient(e) and _retry_after(e) is None:
+                self._failures += 1
+                if probe or self._failures >= self.failure_threshold:
+                    self._opened = time.monotonic()
+            raise
+        else:
+            self._failures = 0
+            self._opened = None
+            return result
+        finally:
+            if probe:
+                self._probing = False
+
+
+def _retry_after(error):
+    """Seconds to wait according to a 429 response, None otherwise"""
+    if getattr(error, 'status', None) != 429:
+        return None
+    value = (getattr(error, 'headers', None) or {}).get('Retry-After')
+    if value is None:
+        return 1.0
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return 1.0
@@ -1,4 +1,13 @@
+from .decode import parse_date
+
+
 class Profile:
+    __slots__ = ('id', 'user_name', 'email', 'allowed_buy', 'first_name',
+                 'last_name', 'is_staff', 'is_current')
+    # fields of the api used by from_api
+    api_fields = ('id', 'username', 'email', 'allowed_buy', 'first_name',
+                  'last_name', 'is_staff', 'is_current')
+
     def __init__(self, id, username, email, allowed_buy,
                  first_name, last_name, is_staff, is_current, **kwargs):
         self.id = id
@@ -10,6 +19,20 @@ class Profile:
         self.is_staff = is_staff
         self.is_current = is_current
 
+    @classmethod
+    def from_api(cls, d):
+        """Faster than cls(**d) for dicts decoded from the api"""
+        self = cls.__new__(cls)
+        self.id = d['id']
+        self.user_name = d['username']
+        self.email = d['email']
+        self.allowed_buy = d['allowed_buy']
+        self.first_name = d['first_name']
+        self.last_name = d['last_name']
+        self.is_staff = d['is_staff']
+        self.is_current = d['is_current']
+        return self
+
     @property
     def name(self):
         name = ''
@@ -23,6 +46,9 @@ class Profile:
 
 
 class Product:
+    __slots__ = ('id', 'name', 'quantity', 'price_cent', 'displayed')
+    api_fields = __slots__
+
     def __init__(self, id, name, quantity, price_cent, displayed, **kwargs):
         self.id = id
         self.name = name
@@ -30,24 +56,65 @@ class Product:
         self.price_cent = price_cent
         self.displayed = displayed
 
+    @classmethod
+    def from_api(cls, d):
+        """Faster than cls(**d) for dicts decoded from the api"""
+        self = cls.__new__(cls)
+        self.id = d['id']
+        self.name = d['name']
+        self.quantity = d['quantity']
+        self.price_cent = d['price_cent']
+        self.displayed = d['displayed']
+        return self
+
 
 class SaleEntry:
+    __slots__ = ('id', 'profile', 'product', '_date')
+
     def __init__(self, id, profile, product, date, **kwargs):
+        """date is a datetime or the api's timestamp string, which is parsed
+        on first access only
+        """
         self.id = id
         self.profile = profile
         self.product = product
-        self.date = date
+        self._date = date
+
+    @property
+    def date(self):
+        if isinstance(self._date, str):
+            self._date = parse_date(self._date)
+        return self._date
+
+    @date.setter
+    def date(self, date):
+        self._date = date
 
 
 class Event:
+    __slots__ = ('id', 'name', 'price_group', 'active')
+    api_fields = __slots__
+
     def __init__(self, id, name, price_group, active, **kwargs):
         self.id = id
         self.name = name
         self.price_group = price_group
         self.active = active
 
+    @classmethod
+    def from_api(cls, d):
+        """Faster than cls(**d) for dicts decoded from the api"""
+        self = cls.__new__(cls)
+        self.id = d['id']
+        self.name = d['name']
+        self.price_group = d['price_group']
+        self.active = d['active']
+        return self
+
 
 class Comment:
+    __slots__ = ('profile', 'comment')
+
     def __init__(self, profile, comment, **kwargs):
         self.profile = profile
         self.comment = comment
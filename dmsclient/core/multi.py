@@ -0,0 +1,90 @@
+import asyncio
+
+from collections import OrderedDict
+from .client import DmsClient, RequestCounters, create_session
+from .metrics import metrics_trace_config
+from .table import SaleTable
+from .utility import construct_sale_entries
+
+__all__ = ['MultiDmsClient']
+
+
+class MultiDmsClient:
+    """Fan out requests to several DMS instances at once.
+
+    endpoints maps names to (token, api_endpoint), e.g.
+    DmsConfig.endpoints. All clients share one session, such that
+    connections are pooled, and every fan out takes as long as the slowest
+    instance. Remaining arguments are passed on to every DmsClient.
+    """
+
+    def __init__(self, endpoints, session_options=None, **kwargs):
+        self.endpoints = OrderedDict(endpoints)
+        self.session_options = session_options or {}
+        self.session = None
+        self.clients = OrderedDict()
+        self._kwargs = kwargs
+
+    def connect(self):
+        options = dict(self.session_options)
+        if self._kwargs.get('metrics') is not None:
+            options['trace_configs'] = (
+                list(options.get('trace_configs') or []) +
+                [metrics_trace_config()])
+        self.session = create_session(**options)
+        self.clients = OrderedDict(
+            (name, DmsClient(token, api, session=self.session,
+                             **self._kwargs))
+            for name, (token, api) in self.endpoints.items())
+
+    async def _disconnect(self):
+        if self.session:
+            await self.session.close()
+
+    async def __aenter__(self):
+        self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self._disconnect()
+
+    @property
+    def counters(self):
+        """RequestCounters summed over all clients"""
+        total = RequestCounters()
+        for client in self.clients.values():
+            total.sent += client.counters.sent
+            total.coalesced += client.counters.coalesced
+            total.cached += client.counters.cached
+        return total
+
+    async def map(self, fn):
+        """Await fn(client) for all clients at once. Returns an OrderedDict
+        of endpoint name to result, or to the exception if it failed.
+        """
+        names = list(self.clients)
+        results = await asyncio.gather(
+            *[fn(self.clients[name]) for name in names],
+            return_exceptions=True)
+        return OrderedDict(zip(names, results))
+
+    async def sale_history(self, num_days=None):
+        return await self.map(lambda c: c.sale_history(num_days))
+
+    async def sale_entries(self, num_days=None, orders=False):
+        """SaleEntries of every endpoint, or its orders if requested"""
+        async def fetch(client):
+            sales = client.orders if orders else client.sale_history(num_days)
+            sales, profiles, products = await asyncio.gather(
+                sales, client.profiles, client.products)
+            return construct_sale_entries(sales, profiles, products)
+        return await self.map(fetch)
+
+    async def sale_tables(self, num_days=None):
+        """SaleTable of every endpoint, see SaleTable.concat to merge them"""
+        async def fetch(client):
+            sales, profiles, products = await asyncio.gather(
+                client.sale_history(num_days), client.profiles,
+                client.products)
+            return SaleTable.from_sales(sales, profiles, products)
+        return await self.map(fetch)
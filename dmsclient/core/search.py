@@ -0,0 +1,184 @@
+import re
+
+from bisect import bisect_left
+from functools import lru_cache
+
+__all__ = ['SearchIndex', 'PrefixIndex', 'scan', 'product_index',
+           'profile_index', 'product_completions', 'profile_completions']
+
+
+class SearchIndex:
+    """Reusable trigram index over choices for repeated partial queries.
+
+    Build it once per catalog snapshot. A query like 'max must' or 'sp*zi'
+    matches keys containing the fragments in order, case insensitive.
+    Results are ranked: keys containing the query as whole words first, then
+    keys starting with the query, then keys with a word starting with it,
+    shorter keys first.
+    """
+
+    def __init__(self, choices, keys=None):
+        """keys(choice) returns the strings a choice is found by.
+        Defaults to the choice itself.
+        """
+        self.choices = list(choices)
+        self._keys = []
+        self._owners = []
+        self._grams = {}
+        for i, choice in enumerate(self.choices):
+            for key in (keys(choice) if keys else [choice]):
+                self._add(key.lower(), i)
+
+    def search(self, query):
+        """Return all choices matching query, best match first"""
+        if query is None:
+            return list(self.choices)
+
+        fragments = _fragments(query)
+        if not fragments:
+            return list(self.choices)
+
+        regex, scores = _compile(tuple(fragments))
+        best = {}
+        for k in self._candidates(fragments):
+            key = self._keys[k]
+            if regex.search(key) is None:
+                continue
+            rank = (_score(key, scores), len(key), k)
+            owner = self._owners[k]
+            if owner not in best or rank < best[owner]:
+                best[owner] = rank
+        ranked = sorted(best, key=best.get)
+        return [self.choices[i] for i in ranked]
+
+    def _add(self, key, owner):
+        k = len(self._keys)
+        self._keys.append(key)
+        self._owners.append(owner)
+        for gram in _trigrams(key):
+            self._grams.setdefault(gram, []).append(k)
+
+    def _candidates(self, fragments):
+        """Keys containing all trigrams of the fragments. Fragments shorter
+        than a trigram can't narrow the search down.
+        """
+        grams = set()
+        for fragment in fragments:
+            grams.update(_trigrams(fragment))
+        if not grams:
+            return range(len(self._keys))
+
+        postings = sorted((self._grams.get(g, []) for g in grams), key=len)
+        result = set(postings[0])
+        for p in postings[1:]:
+            result.intersection_update(p)
+            if not result:
+                break
+        return sorted(result)
+
+
+def scan(query, choices, keys=None):
+    """Like SearchIndex(choices, keys).search(query), but scanning all
+    keys once instead of building an index, which is faster for a single
+    query.
+    """
+    choices = list(choices)
+    fragments = _fragments(query) if query is not None else None
+    if not fragments:
+        return choices
+
+    regex, scores = _compile(tuple(fragments))
+    best = {}
+    k = 0
+    for i, choice in enumerate(choices):
+        for key in (keys(choice) if keys else [choice]):
+            key = key.lower()
+            if regex.search(key) is not None:
+                rank = (_score(key, scores), len(key), k)
+                if i not in best or rank < best[i]:
+                    best[i] = rank
+            k += 1
+    return [choices[i] for i in sorted(best, key=best.get)]
+
+
+class PrefixIndex:
+    """Sorted words for completing a prefix with two binary searches,
+    case insensitive
+    """
+
+    def __init__(self, words):
+        by_key = {}
+        for word in words:
+            by_key.setdefault(word.lower(), word)
+        self._keys = sorted(by_key)
+        self._words = [by_key[k] for k in self._keys]
+
+    def complete(self, prefix):
+        """All words starting with prefix, in alphabetical order"""
+        prefix = prefix.lower()
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + '\U0010ffff', lo)
+        return self._words[lo:hi]
+
+
+def product_index(products, aliases=None):
+    """Index products by name and by aliases of the structure
+    (alias, prod_name)
+    """
+    return SearchIndex(products, _product_keys(aliases))
+
+
+def profile_index(profiles):
+    """Index the profiles allowed to buy by name and user name"""
+    return SearchIndex([p for p in profiles if p.allowed_buy], _profile_keys)
+
+
+def _product_keys(aliases=None):
+    by_name = {}
+    for alias, name in aliases or []:
+        by_name.setdefault(name, []).append(alias)
+    return lambda p: by_name.get(p.name, []) + [p.name]
+
+
+def _profile_keys(profile):
+    return ["{} {} {}".format(
+        profile.first_name, profile.last_name, profile.user_name)]
+
+
+def product_completions(products, aliases=None):
+    """PrefixIndex of the words of product names and of aliases"""
+    return PrefixIndex([w for p in products for w in p.name.split()] +
+                       [alias for alias, _ in aliases or []])
+
+
+def profile_completions(profiles):
+    """PrefixIndex of the names of the profiles allowed to buy"""
+    return PrefixIndex(w for p in profiles if p.allowed_buy
+                       for w in (p.first_name, p.last_name, p.user_name)
+                       if w)
+
+
+def _fragments(query):
+    return [f for f in re.split(r'[*\s]+', query.lower()) if f]
+
+
+def _score(key, scores):
+    """Index of the first ranking regex matching key"""
+    return next((i for i, s in enumerate(scores) if s.search(key)),
+                len(scores))
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@lru_cache(maxsize=128)
+def _compile(fragments):
+    """Compile the matching regex and the ranking regexes of a query"""
+    regex = re.compile('.*'.join(re.escape(f) for f in fragments), re.DOTALL)
+    first = re.escape(fragments[0])
+    scores = (re.compile(r'(?:^|\s)' + r'\s+'.join(map(re.escape, fragments))
+                         + r'(?:\s|$)'),
+              re.compile(r'\A' + first),
+              re.compile(r'\b' + first))
+    return regex, scores
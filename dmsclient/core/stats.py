@@ -0,0 +1,88 @@
+from collections import Counter
+from datetime import date, timedelta
+
+__all__ = [
+    'count_by_product', 'count_by_profile',
+    'revenue_by_product', 'revenue_by_profile',
+    'daily_histogram', 'hourly_histogram',
+    'top_consumers', 'restock_estimate']
+
+
+_DAY = 24 * 60 * 60
+_HOUR = 60 * 60
+
+
+def count_by_product(table):
+    """List of (product, number of sales), most sold first"""
+    return [(table.products[i], n)
+            for i, n in Counter(table.product_idx).most_common()]
+
+
+def count_by_profile(table):
+    """List of (profile, number of sales), best customer first"""
+    return [(table.profiles[i], n)
+            for i, n in Counter(table.profile_idx).most_common()]
+
+
+def revenue_by_product(table):
+    """List of (product, revenue in cent), highest revenue first.
+    Products without price don't generate revenue.
+    """
+    revenue = [(table.products[i], n * (table.products[i].price_cent or 0))
+               for i, n in Counter(table.product_idx).items()]
+    return sorted(revenue, key=lambda x: x[1], reverse=True)
+
+
+def revenue_by_profile(table):
+    """List of (profile, spent money in cent), highest revenue first"""
+    prices = [p.price_cent or 0 for p in table.products]
+    spent = Counter()
+    for (profile, product), n in Counter(zip(table.profile_idx,
+                                             table.product_idx)).items():
+        spent[profile] += n * prices[product]
+    return [(table.profiles[i], cent) for i, cent in spent.most_common()]
+
+
+def daily_histogram(table):
+    """List of (date, number of sales) for every day in the table's range"""
+    if len(table) == 0:
+        return []
+    days = Counter(int(t // _DAY) for t in table.timestamps)
+    first, last = min(days), max(days)
+    epoch = date(1970, 1, 1)
+    return [(epoch + timedelta(days=d), days[d])
+            for d in range(first, last + 1)]
+
+
+def hourly_histogram(table):
+    """Number of sales per hour of the day, index 0 is midnight"""
+    hours = Counter(int(t // _HOUR) % 24 for t in table.timestamps)
+    return [hours[h] for h in range(24)]
+
+
+def top_consumers(table, k=10):
+    """List of the k (profile, number of sales) with most sales"""
+    return [(table.profiles[i], n)
+            for i, n in Counter(table.profile_idx).most_common(k)]
+
+
+def restock_estimate(table, days=None):
+    """Estimate when products run out at the consumption rate of the table.
+
+    Rates are per day over the given number of days, by default the table's
+    time span. Returns a list of (product, sales per day, days left),
+    soonest first. Days left is None for products not sold at all.
+    """
+    if days is None:
+        if len(table) > 0:
+            days = max((max(table.timestamps) - min(table.timestamps)) / _DAY,
+                       1)
+        else:
+            days = 1
+    counts = Counter(table.product_idx)
+    estimate = []
+    for i, product in enumerate(table.products):
+        rate = counts[i] / days
+        left = max(product.quantity, 0) / rate if rate > 0 else None
+        estimate.append((product, rate, left))
+    return sorted(estimate, key=lambda x: (x[2] is None, x[2]))
@@ -0,0 +1,116 @@
+import sqlite3
+
+from datetime import datetime, timedelta
+
+__all__ = ['SalesStore']
+
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    profile INTEGER NOT NULL,
+    product INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS sales_date ON sales (date);
+CREATE INDEX IF NOT EXISTS sales_profile ON sales (profile, date);
+CREATE INDEX IF NOT EXISTS sales_product ON sales (product, date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL);
+'''
+
+
+class SalesStore:
+    """Local SQLite copy of the sales history, indexed by date, profile
+    and product.
+
+    sync fetches only the days since the last sync, plus one day overlap
+    against clock skew. Older days are fetched once, when a sync asks for
+    more history than the store covers.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    async def sync(self, client, num_days=None):
+        """Fetch new sales, such that the store covers the last num_days
+        (all if None). Returns the number of new sales.
+        """
+        now = datetime.now()
+        synced_at = self._meta('synced_at')
+        covered_from = self._meta('covered_from')
+        wanted_from = '' if num_days is None else (
+            now - timedelta(days=num_days)).strftime(DATE_FORMAT)
+
+        if synced_at is None or wanted_from < covered_from:
+            fetch_days = num_days
+            covered_from = wanted_from
+        else:
+            since = datetime.strptime(synced_at, DATE_FORMAT)
+            fetch_days = (now - since).days + 1
+
+        before = self._count()
+        batch = []
+        async for sale in client.iter_sale_history(fetch_days):
+            batch.append((sale['id'], sale['date'],
+                          sale['profile'], sale['product']))
+            if len(batch) >= 1000:
+                self._insert(batch)
+                batch = []
+        self._insert(batch)
+        self._set_meta('synced_at', now.strftime(DATE_FORMAT))
+        self._set_meta('covered_from', covered_from)
+        self._db.commit()
+        return self._count() - before
+
+    def sales(self, num_days=None, profile_id=None, product_id=None):
+        """Stored sales like DmsClient.sale_history returns them, in the
+        order of the server, oldest first. Optionally only of a profile or
+        product.
+        """
+        query = 'SELECT id, profile, product, date FROM sales WHERE 1'
+        params = []
+        if num_days is not None:
+            query += ' AND date >= ?'
+            params.append((datetime.now() - timedelta(days=num_days))
+                          .strftime(DATE_FORMAT))
+        if profile_id is not None:
+            query += ' AND profile = ?'
+            params.append(profile_id)
+        if product_id is not None:
+            query += ' AND product = ?'
+            params.append(product_id)
+        query += ' ORDER BY date, id'
+        return [{'id': id, 'profile': profile, 'product': product,
+                 'date': date}
+                for id, profile, product, date in
+                self._db.execute(query, params)]
+
+    def _count(self):
+        return self._db.execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+
+    def _insert(self, rows):
+        self._db.executemany(
+            'INSERT OR IGNORE INTO sales (id, date, profile, product) '
+            'VALUES (?, ?, ?, ?)', rows)
+
+    def _meta(self, key):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?',
+                               (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO meta (key, value) '
+                         'VALUES (?, ?)', (key, value))
@@ -0,0 +1,47 @@
+import codecs
+import json
+import re
+
+__all__ = ['iter_json_array']
+
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+async def iter_json_array(chunks):
+    """Incrementally decode a json array from an async iterable of byte
+    chunks and yield its elements as soon as they are complete.
+    Memory is bounded by the chunk and element size, not the array size.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    started = False
+    async for chunk in chunks:
+        buf += text.decode(chunk)
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError('Expected a json array.')
+                started = True
+                pos += 1
+            elif buf[pos] == ',':
+                pos += 1
+            elif buf[pos] == ']':
+                return
+            else:
+                try:
+                    element, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    break  # element continues in the next chunk
+                after = _WHITESPACE.match(buf, end).end()
+                if after == len(buf) or buf[after] not in ',]':
+                    break  # e.g. a number might continue in the next chunk
+                yield element
+                pos = after
+        buf = buf[pos:]
+    raise ValueError('Unexpected end of json array.')
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+from .client import DmsClient
+
+__all__ = ['SyncDmsClient']
+
+
+class SyncDmsClient:
+    """Blocking facade of DmsClient for synchronous code.
+
+    One event loop runs in a background thread for the lifetime of the
+    client and keeps the session and its connections alive between calls.
+    All methods are thread safe, many threads can share one client.
+    Arguments are passed on to DmsClient.
+    """
+
+    def __init__(self, token, api_endpoint, **kwargs):
+        self.client = DmsClient(token, api_endpoint, **kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop,
+                                        name='dmsclient', daemon=True)
+        self._thread.start()
+        self._call(self._connect())
+
+    def close(self):
+        """Close the session and stop the background thread"""
+        if self._loop.is_closed():
+            return
+        self._call(self.client._disconnect())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def profiles(self):
+        return self._call(self.client.profiles)
+
+    @property
+    def current_profile(self):
+        return self._call(self.client.current_profile)
+
+    @property
+    def orders(self):
+        return self._call(self.client.orders)
+
+    @property
+    def sales(self):
+        return self._call(self.client.sales)
+
+    @property
+    def products(self):
+        return self._call(self.client.products)
+
+    @property
+    def events(self):
+        return self._call(self.client.events)
+
+    @property
+    def comments(self):
+        return self._call(self.client.comments)
+
+    def sale_history(self, num_days=None):
+        return self._call(self.client.sale_history(num_days))
+
+    def iter_sale_history(self, num_days=None):
+        return self._iterate(self.client.iter_sale_history(num_days))
+
+    def watch(self, **kwargs):
+        return self._iterate(self.client.watch(**kwargs))
+
+    def profile_by_id(self, id):
+        return self._call(self.client.profile_by_id(id))
+
+    def product_by_id(self, id):
+        return self._call(self.client.product_by_id(id))
+
+    def search_products(self, query, **kwargs):
+        return self._call(self.client.search_products(query, **kwargs))
+
+    def search_profiles(self, query):
+        return self._call(self.client.search_profiles(query))
+
+    def add_order(self, product_id, profile_id=None):
+        return self._call(self.client.add_order(product_id, profile_id))
+
+    def add_sale(self, product_id, profile_id=None):
+        return self._call(self.client.add_sale(product_id, profile_id))
+
+    def add_comment(self, comment, profile_id=None):
+        return self._call(self.client.add_comment(comment, profile_id))
+
+    def add_event(self, name, price_group, is_active):
+        return self._call(self.client.add_event(name, price_group, is_active))
+
+    def submit_batch(self, items, **kwargs):
+        return self._call(self.client.submit_batch(items, **kwargs))
+
+    def replay_journal(self, **kwargs):
+        return self._call(self.client.replay_journal(**kwargs))
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _connect(self):
+        # the session has to be created within its event loop
+        self.client.connect()
+
+    def _call(self, coro):
+        """Run coro in the background loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _iterate(self, agen):
+        """Iterate the async generator agen in the background loop"""
+        try:
+            while True:
+                try:
+                    yield self._call(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._call(agen.aclose())
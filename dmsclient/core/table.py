@@ -0,0 +1,155 @@
+from array import array
+from datetime import datetime, timedelta
+from itertools import compress
+
+from .decode import parse_date
+from .models import SaleEntry
+
+__all__ = ['SaleTable']
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class SaleTable:
+    """Columnar store of sale entries.
+
+    Sale ids, indices into the products and profiles lists and timestamps
+    are kept in arrays of 8, 4, 4 and 8 bytes. A row costs 24 bytes instead
+    of a SaleEntry and a datetime object, and filters or sorting work on
+    the arrays.
+    Rows are materialized as SaleEntry only on access.
+    """
+    __slots__ = ('products', 'profiles', 'ids', 'product_idx',
+                 'profile_idx', 'timestamps', '_product_pos', '_profile_pos')
+
+    def __init__(self, products, profiles):
+        """Create an empty table for sales of the given catalog"""
+        self.products = list(products)
+        self.profiles = list(profiles)
+        self.ids = array('q')
+        self.product_idx = array('i')
+        self.profile_idx = array('i')
+        self.timestamps = array('d')
+        self._product_pos = {p.id: i for i, p in enumerate(self.products)}
+        self._profile_pos = {p.id: i for i, p in enumerate(self.profiles)}
+
+    @classmethod
+    def from_sales(cls, sales, profiles, products):
+        """Like construct_sale_entries, but build a SaleTable from the
+        sales retrieved from dms
+        """
+        if not isinstance(sales, list):
+            sales = list(sales)
+        table = cls(products, profiles)
+        profile_pos = table._profile_pos
+        product_pos = table._product_pos
+        table.ids.extend(s['id'] for s in sales)
+        table.profile_idx.extend(profile_pos[s['profile']] for s in sales)
+        table.product_idx.extend(product_pos[s['product']] for s in sales)
+        table.timestamps.extend(_timestamp(parse_date(s['date']))
+                                for s in sales)
+        return table
+
+    @classmethod
+    def concat(cls, tables, key=None):
+        """One table of the rows of all tables, e.g. of several DMS
+        instances. Their products and profiles are kept apart, unless key
+        is given, e.g. attrgetter('name'). Then products and profiles with
+        equal keys are merged into the first of them.
+        Ids of later tables can be shadowed in for_product and for_profile.
+        """
+        table = cls([], [])
+        for t in tables:
+            products = _merge(table.products, t.products, key)
+            profiles = _merge(table.profiles, t.profiles, key)
+            table.ids.extend(t.ids)
+            table.product_idx.extend(products[i] for i in t.product_idx)
+            table.profile_idx.extend(profiles[i] for i in t.profile_idx)
+            table.timestamps.extend(t.timestamps)
+        for pos, catalog in ((table._product_pos, table.products),
+                             (table._profile_pos, table.profiles)):
+            for i, item in enumerate(catalog):
+                pos.setdefault(item.id, i)
+        return table
+
+    def append(self, id, profile_id, product_id, date):
+        self.ids.append(id)
+        self.profile_idx.append(self._profile_pos[profile_id])
+        self.product_idx.append(self._product_pos[product_id])
+        self.timestamps.append(_timestamp(date))
+
+    def date(self, i):
+        return _EPOCH + timedelta(seconds=self.timestamps[i])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return SaleEntry(id=self.ids[i],
+                         profile=self.profiles[self.profile_idx[i]],
+                         product=self.products[self.product_idx[i]],
+                         date=self.date(i))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def take(self, rows):
+        """New table of the given row numbers, sharing the catalog"""
+        table = SaleTable.__new__(SaleTable)
+        table.products = self.products
+        table.profiles = self.profiles
+        table._product_pos = self._product_pos
+        table._profile_pos = self._profile_pos
+        table.ids = array('q', (self.ids[i] for i in rows))
+        table.product_idx = array('i', (self.product_idx[i] for i in rows))
+        table.profile_idx = array('i', (self.profile_idx[i] for i in rows))
+        table.timestamps = array('d', (self.timestamps[i] for i in rows))
+        return table
+
+    def for_product(self, product_id):
+        pos = self._product_pos[product_id]
+        return self.take(list(compress(range(len(self)),
+                                       map(pos.__eq__, self.product_idx))))
+
+    def for_profile(self, profile_id):
+        pos = self._profile_pos[profile_id]
+        return self.take(list(compress(range(len(self)),
+                                       map(pos.__eq__, self.profile_idx))))
+
+    def between(self, start=None, end=None):
+        """Sales with start <= date < end. Open ended if None."""
+        lo = float('-inf') if start is None else _timestamp(start)
+        hi = float('inf') if end is None else _timestamp(end)
+        return self.take([i for i, t in enumerate(self.timestamps)
+                          if lo <= t < hi])
+
+    def sorted_by_date(self, reverse=False):
+        return self.take(sorted(range(len(self)),
+                                key=self.timestamps.__getitem__,
+                                reverse=reverse))
+
+
+def _merge(catalog, items, key=None):
+    """Append items to catalog, unless an item of equal key is in it.
+    Items are only merged with those of earlier tables, not among each
+    other, e.g. two profiles of the same name of one DMS stay apart.
+    Returns the positions of the items in catalog.
+    """
+    known = {}
+    if key is not None:
+        for i, c in enumerate(catalog):
+            known.setdefault(key(c), i)
+    positions = []
+    for item in items:
+        pos = None if key is None else known.get(key(item))
+        if pos is None:
+            pos = len(catalog)
+            catalog.append(item)
+        positions.append(pos)
+    return positions
+
+
+def _timestamp(date):
+    """Seconds since epoch of a naive datetime, independent of timezones"""
+    return (date - _EPOCH).total_seconds()
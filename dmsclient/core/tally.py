@@ -0,0 +1,118 @@
+import csv
+import json
+
+from .batch import BatchItem
+
+__all__ = ['TallyRow', 'read_tally', 'resolve_tally']
+
+
+class TallyRow:
+    """Row of a tally sheet: count sales of a product for a user, both
+    given as queries like for 'dms buy'. line is the line in the file.
+
+    resolve_tally fills in the matching profiles and products.
+    """
+    __slots__ = ('line', 'user', 'product', 'count', 'profiles', 'products')
+
+    def __init__(self, line, user, product, count=1):
+        self.line = line
+        self.user = user
+        self.product = product
+        self.count = count
+        self.profiles = None
+        self.products = None
+
+    @property
+    def problem(self):
+        """Why the row can't be imported, None if it can"""
+        if self.user is None or self.product is None:
+            return 'malformed row'
+        elif not isinstance(self.count, int) or self.count < 1:
+            return 'invalid count {!r}'.format(self.count)
+        for query, matches in ((self.user, self.profiles),
+                               (self.product, self.products)):
+            if not matches:
+                return "nothing like '{}' found".format(query)
+            elif len(matches) > 1:
+                return "'{}' is ambiguous".format(query)
+        return None
+
+    def batch_item(self):
+        return BatchItem(self.products[0].id, self.profiles[0].id, self.count)
+
+
+def read_tally(f, fmt='csv'):
+    """Stream TallyRows from a file of lines user,product,count as 'csv'
+    or 'tsv', with an optional header, or of json objects with these keys
+    as 'jsonl'. A missing count is 1.
+    """
+    if fmt == 'jsonl':
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            if not isinstance(row, dict):
+                yield TallyRow(line, None, None)
+                continue
+            yield TallyRow(line, row.get('user'), row.get('product'),
+                           _count(row.get('count', 1)))
+        return
+
+    reader = csv.reader(f, delimiter='\t' if fmt == 'tsv' else ',')
+    for row in reader:
+        row = [cell.strip() for cell in row]
+        if not any(row):
+            continue
+        if reader.line_num == 1 and row[0].lower() in ('user', 'profile'):
+            continue
+        row += [''] * (3 - len(row))
+        yield TallyRow(reader.line_num, row[0] or None, row[1] or None,
+                       _count(row[2] or 1))
+
+
+def resolve_tally(rows, catalog):
+    """Look up the users and products of TallyRows in a Catalog. Queries
+    matching a name, user name or alias exactly resolve to it, others to
+    all matches. Repeated queries are looked up once. Returns the rows.
+    """
+    aliases = dict(catalog.aliases or [])
+    profiles = {}
+    products = {}
+    rows = list(rows)
+    for row in rows:
+        if row.user not in profiles:
+            profiles[row.user] = _lookup(
+                row.user, catalog.search_profiles, catalog.profile_by_id,
+                lambda p, q: q in (p.name.lower(), p.user_name.lower()))
+        if row.product not in products:
+            products[row.product] = _lookup(
+                row.product, catalog.search_products, catalog.product_by_id,
+                lambda p, q: p.name.lower() in (q, aliases.get(q, '').lower()))
+        row.profiles = profiles[row.user]
+        row.products = products[row.product]
+    return rows
+
+
+def _lookup(query, search, by_id, exact):
+    if not query:
+        return []
+    try:
+        match = by_id(int(query))
+        return [match] if match is not None else []
+    except ValueError:
+        pass
+    matches = search(query)
+    exact_matches = [m for m in matches if exact(m, query.lower())]
+    if len(exact_matches) == 1:
+        return exact_matches
+    return matches
+
+
+def _count(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
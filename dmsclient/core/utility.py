@@ -1,69 +1,48 @@
-import re
-
-from datetime import datetime
 from .models import Comment, SaleEntry
+from .search import _product_keys, _profile_keys, scan
 
 __all__ = [
     'search_product', 'search_profile',
-    'construct_sale_entries', 'construct_comments']
+    'construct_sale_entries', 'iter_sale_entries', 'construct_comments']
 
 
 def search_product(query, products, aliases=None):
-    """Search products retrieved from dms matching the query.
-    Optionally provide a list of aliases of the structure (aliase, prod_name)
+    """Search products retrieved from dms matching the query, best match
+    first. Optionally provide a list of aliases of the structure
+    (aliase, prod_name).
+    For repeated queries build a product_index once instead.
     """
-    result = list()
-    if aliases and len(aliases) > 0:
-        alias_match = _search(query, aliases, lambda x: x[0])
-        alias_names = [name for _, name in alias_match]
-        result.extend([p for p in products if p.name in alias_names])
-
-    prod_match = _search(query, products, lambda x: x.name)
-
-    for p in prod_match:
-        if p not in result:
-            result.append(p)
-    return result
+    return scan(query, products, _product_keys(aliases))
 
 
 def search_profile(query, profiles):
-    profiles = [p for p in profiles if p.allowed_buy]
-
-    def build_name(u): return "{} {} {}".format(
-        u.first_name, u.last_name, u.user_name)
-
-    return _search(query, profiles, build_name)
-
-
-def _search(query, choices, accessor=None):
-    """Search for matches of query in choices.
-    query.match(choise)
-    Optionally provide an accessor:
-    query.match(accessor(choise))
+    """Search profiles allowed to buy matching the query, best match first.
+    For repeated queries build a profile_index once instead.
     """
-    if query is None:
-        return choices
+    return scan(query, [p for p in profiles if p.allowed_buy], _profile_keys)
 
-    regex = re.compile(query.replace("*", ".*").replace(" ", ".*"),
-                       re.IGNORECASE | re.DOTALL)
-    if accessor:
-        def filter_(x): return regex.search(accessor(x)) is not None
-    else:
-        def filter_(x): return regex.search(x) is not None
 
-    result = [c for c in choices if filter_(c)]
-    return result
+def construct_sale_entries(sales, profiles, products):
+    profiles = {p.id: p for p in profiles}
+    products = {p.id: p for p in products}
+    return [_sale_entry(s, profiles, products) for s in sales]
 
 
-def construct_sale_entries(sales, profiles, products):
+async def iter_sale_entries(sales, profiles, products):
+    """Like construct_sale_entries, but for an async iterable of sales,
+    e.g. DmsClient.iter_sale_history
+    """
     profiles = {p.id: p for p in profiles}
     products = {p.id: p for p in products}
-    return [SaleEntry(id=s['id'],
-                      profile=profiles[s['profile']],
-                      product=products[s['product']],
-                      date=datetime.strptime(s['date'],
-                                             '%Y-%m-%dT%H:%M:%S.%f'))
-            for s in sales]
+    async for s in sales:
+        yield _sale_entry(s, profiles, products)
+
+
+def _sale_entry(sale, profiles, products):
+    return SaleEntry(sale['id'],
+                     profiles[sale['profile']],
+                     products[sale['product']],
+                     sale['date'])
 
 
 def construct_comments(comments, profiles):
@@ -0,0 +1,279 @@
+"""Local stand-in for the DMS api, for benchmarks and offline testing.
+Run it with python -m dmsclient.fakeserver.
+
+Usage:
+  fakeserver [options]
+
+Options:
+  --host=<host>           Host to listen on [default: localhost].
+  --port=<port>           Port to listen on [default: 8080].
+  --profiles=<n>          Number of profiles [default: 500].
+  --products=<n>          Number of products [default: 50].
+  --sales=<n>             Number of sales [default: 10000].
+  --days=<n>              Days the sales are spread over [default: 365].
+  --latency=<s>           Seconds added to every response [default: 0].
+  --error-rate=<r>        Fraction of requests failing with 503 [default: 0].
+  --seed=<seed>           Seed of the generated dataset [default: 0].
+  --no-filters            Ignore search and filter parameters.
+  -h, --help              Show this screen.
+
+The api is served at http://<host>:<port>/api, any token is accepted.
+"""
+import asyncio
+import hashlib
+import json
+import random
+
+from datetime import datetime, timedelta
+from aiohttp import web
+
+__all__ = ['FakeDms']
+
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class FakeDms:
+    """In-memory DMS api with a generated dataset.
+
+    Every response is delayed by latency seconds and fails with 503 at
+    error_rate. GETs support ETag revalidation, compression and selection of
+    fields, e.g. ?fields=id,name. POSTs with a known Idempotency-Key are not
+    applied twice. Profiles and products can be searched and filtered like
+    with Django REST framework, e.g. /profiles/?search=max&allowed_buy=true,
+    unless filters is false.
+    """
+
+    def __init__(self, num_profiles=500, num_products=50, num_sales=10000,
+                 days=365, latency=0.0, error_rate=0.0, seed=0, filters=True):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.filters = filters
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._idempotency_keys = set()
+        self._runner = None
+
+        rnd = self._random
+        self.profiles = [{'id': i,
+                          'username': 'user{}'.format(i),
+                          'email': 'user{}@example.org'.format(i),
+                          'allowed_buy': i % 20 != 0,
+                          'first_name': 'First{}'.format(i),
+                          'last_name': 'Last{}'.format(i),
+                          'is_staff': i == 1,
+                          'is_current': i == 1}
+                         for i in range(1, num_profiles + 1)]
+        self.products = [{'id': i,
+                          'name': 'Product {}'.format(i),
+                          'quantity': rnd.randint(0, 100),
+                          'price_cent': rnd.choice([50, 70, 100, 150]),
+                          'displayed': i % 10 != 0}
+                         for i in range(1, num_products + 1)]
+        self.events = [{'id': 1, 'name': 'Default', 'price_group': 1,
+                        'active': True}]
+        self.comments = []
+        self.orders = []
+
+        now = datetime.now()
+        dates = sorted(now - timedelta(seconds=rnd.uniform(0, days * 86400))
+                       for _ in range(num_sales))
+        self.sales = [self._entry(i, rnd.choice(self.profiles)['id'],
+                                  rnd.choice(self.products)['id'], date)
+                      for i, date in enumerate(dates, 1)]
+
+    def app(self):
+        app = web.Application(middlewares=[self._middleware])
+        r = app.router
+        r.add_get('/api/profiles/', self._list(
+            lambda: self.profiles, ('username', 'first_name', 'last_name')))
+        r.add_get('/api/profiles/{id}/', self._profile)
+        r.add_get('/api/products/', self._list(lambda: self.products,
+                                               ('name',)))
+        r.add_get('/api/products/{id}/', self._product)
+        r.add_get('/api/events/', self._list(lambda: self.events))
+        r.add_post('/api/events/', self._add_event)
+        r.add_get('/api/comments/', self._list(lambda: self.comments))
+        r.add_post('/api/comments/', self._add_comment)
+        r.add_get('/api/orders/', self._list(lambda: self.orders))
+        r.add_post('/api/orders/', self._add_order)
+        r.add_get('/api/sales/', self._sales)
+        r.add_get('/api/sales/{days}/', self._sales)
+        r.add_post('/api/sales/', self._add_sale)
+        return app
+
+    async def start(self, host='localhost', port=0):
+        """Serve the api in the running event loop. Returns its url."""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return 'http://{}:{}/api'.format(host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if not request.headers.get('Authorization', '').startswith('Token '):
+            return web.json_response({'detail': 'Not authenticated.'},
+                                     status=401)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.json_response({'detail': 'Injected error.'},
+                                     status=503)
+        if request.method == 'POST':
+            key = request.headers.get('Idempotency-Key')
+            if key is not None and key in self._idempotency_keys:
+                return web.json_response({}, status=201)
+            response = await handler(request)
+            if key is not None and response.status < 300:
+                self._idempotency_keys.add(key)
+            return response
+        return await handler(request)
+
+    def _list(self, items, search_fields=()):
+        async def handler(request):
+            if self.filters:
+                return _json_response(request, _filter(
+                    items(), request.query, search_fields))
+            return _json_response(request, items())
+        return handler
+
+    async def _profile(self, request):
+        if request.match_info['id'] == 'current':
+            return _json_response(request, self.profiles[0])
+        return _json_response(request, _find(self.profiles,
+                                             request.match_info['id']))
+
+    async def _product(self, request):
+        return _json_response(request, _find(self.products,
+                                             request.match_info['id']))
+
+    async def _sales(self, request):
+        days = request.match_info.get('days')
+        sales = self.sales
+        if days:
+            try:
+                start = datetime.now() - timedelta(days=int(days))
+            except ValueError:
+                raise web.HTTPNotFound()
+            start = start.strftime(DATE_FORMAT)
+            sales = [s for s in sales if s['date'] >= start]
+        return _json_response(request, sales)
+
+    async def _add_sale(self, request):
+        return await self._add_entry(request, self.sales)
+
+    async def _add_order(self, request):
+        return await self._add_entry(request, self.orders)
+
+    async def _add_entry(self, request, entries):
+        data = await request.json()
+        profile = _find(self.profiles, data.get('profile'))
+        product = _find(self.products, data.get('product'))
+        if not profile['allowed_buy']:
+            raise web.HTTPBadRequest(text='Profile is not allowed to buy.')
+        if product['quantity'] <= 0:
+            raise web.HTTPBadRequest(text='Product is sold out.')
+        product['quantity'] -= 1
+        entry = self._entry(len(entries) + 1, profile['id'], product['id'],
+                            datetime.now())
+        entries.append(entry)
+        return web.json_response(entry, status=201)
+
+    async def _add_comment(self, request):
+        data = await request.json()
+        _find(self.profiles, data.get('profile'))
+        self.comments.append({'profile': data['profile'],
+                              'comment': data.get('comment', '')})
+        return web.json_response(self.comments[-1], status=201)
+
+    async def _add_event(self, request):
+        data = await request.json()
+        event = {'id': len(self.events) + 1,
+                 'name': data.get('name'),
+                 'price_group': data.get('price_group'),
+                 'active': data.get('active')}
+        self.events.append(event)
+        return web.json_response(event, status=201)
+
+    @staticmethod
+    def _entry(id, profile, product, date):
+        return {'id': id, 'profile': profile, 'product': product,
+                'date': date.strftime(DATE_FORMAT)}
+
+
+def _find(items, id):
+    try:
+        id = int(id)
+    except (TypeError, ValueError):
+        raise web.HTTPNotFound()
+    for item in items:
+        if item['id'] == id:
+            return item
+    raise web.HTTPNotFound()
+
+
+def _filter(items, query, search_fields):
+    """Items with all search terms in one of search_fields each, and with
+    fields equal to boolean parameters or greater than field__gt
+    """
+    for param, value in query.items():
+        if param == 'search':
+            for term in value.lower().split():
+                items = [i for i in items
+                         if any(term in i[f].lower() for f in search_fields)]
+        elif param.endswith('__gt'):
+            field = param[:-len('__gt')]
+            items = [i for i in items if i.get(field) is not None and
+                     i[field] > int(value)]
+        elif value in ('true', 'false'):
+            items = [i for i in items if i.get(param) == (value == 'true')]
+    return items
+
+
+def _project(data, fields):
+    """Only the fields of an item or a list of items"""
+    if isinstance(data, dict):
+        return {f: data[f] for f in fields if f in data}
+    return [_project(item, fields) for item in data]
+
+
+def _json_response(request, data):
+    if 'fields' in request.query:
+        data = _project(data, request.query['fields'].split(','))
+    body = json.dumps(data).encode('utf-8')
+    etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag})
+    response = web.Response(body=body, content_type='application/json',
+                            headers={'ETag': etag})
+    response.enable_compression()
+    return response
+
+
+def main():
+    from docopt import docopt
+    args = docopt(__doc__)
+    server = FakeDms(num_profiles=int(args['--profiles']),
+                     num_products=int(args['--products']),
+                     num_sales=int(args['--sales']),
+                     days=int(args['--days']),
+                     latency=float(args['--latency']),
+                     error_rate=float(args['--error-rate']),
+                     seed=int(args['--seed']),
+                     filters=not args['--no-filters'])
+    print('Serving fake DMS at http://{}:{}/api'.format(args['--host'],
+                                                        args['--port']))
+    web.run_app(server.app(), host=args['--host'], port=int(args['--port']),
+                print=None)
+
+
+if __name__ == "__main__":
+    main()
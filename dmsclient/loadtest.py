@@ -0,0 +1,332 @@
+"""Load generator for stress-testing a DMS deployment with DmsClients.
+Run it with python -m dmsclient.loadtest, or as dms loadtest.
+
+Usage:
+  loadtest [options] (--fake | <api> <token>)
+
+Options:
+  --rate=<r>          Target requests per second [default: 50].
+  --duration=<s>      Seconds to run [default: 30].
+  --sessions=<n>      Concurrent sessions, like kiosks [default: 20].
+  --workers=<n>       Worker processes [default: 1].
+  --mix=<mix>         Shares of the operations [default: catalog=60,history=25,sale=10,order=5].
+  --fake              Test against an in-process FakeDms.
+  --latency=<s>       Latency of the FakeDms [default: 0.01].
+  -h, --help          Show this screen.
+
+Operations are catalog (products or profiles), history (sale history of the
+last day), sale and order. Sales and orders are real writes.
+"""
+import asyncio
+import math
+import random
+
+from collections import Counter, OrderedDict
+
+from dmsclient.core import DmsClient
+
+__all__ = ['LatencyHistogram', 'LoadResult', 'parse_mix', 'run_load',
+           'format_report']
+
+
+OPERATIONS = ('catalog', 'history', 'sale', 'order')
+
+
+class LatencyHistogram:
+    """Latencies in logarithmic buckets, each 10% wider than the one
+    before, from 0.1 ms. Histograms of several workers can be merged.
+    """
+    __slots__ = ('counts', 'total', 'max')
+
+    _BASE = 1e-4
+    _GROWTH = math.log(1.1)
+
+    def __init__(self):
+        self.counts = Counter()
+        self.total = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[self._bucket(seconds)] += 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Upper bound of the bucket of the p-th percentile in seconds"""
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.total))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self._upper(bucket), self.max)
+        return self.max
+
+    def coarse(self, bounds=(0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1,
+                             0.2, 0.5, 1, 2, 5, 10)):
+        """Counts of latencies up to each of bounds, and above the last.
+        Bucket counts are assigned by their upper bound.
+        """
+        counts = [0] * (len(bounds) + 1)
+        for bucket, n in self.counts.items():
+            upper = self._upper(bucket)
+            i = next((i for i, b in enumerate(bounds) if upper <= b * 1.0001),
+                     len(bounds))
+            counts[i] += n
+        return list(zip(list(bounds) + [None], counts))
+
+    def _bucket(self, seconds):
+        if seconds <= self._BASE:
+            return 0
+        return int(math.ceil(math.log(seconds / self._BASE) / self._GROWTH))
+
+    def _upper(self, bucket):
+        return self._BASE * math.exp(bucket * self._GROWTH)
+
+
+class LoadResult:
+    """Requests, errors and latencies per operation of a load test"""
+
+    def __init__(self, rate=None, duration=None):
+        self.rate = rate
+        self.duration = duration
+        self.elapsed = 0.0
+        self.requests = Counter()
+        self.errors = OrderedDict((op, Counter()) for op in OPERATIONS)
+        self.latencies = OrderedDict((op, LatencyHistogram())
+                                     for op in OPERATIONS)
+
+    def record(self, op, seconds, error=None):
+        self.requests[op] += 1
+        self.latencies[op].record(seconds)
+        if error is not None:
+            self.errors[op][error] += 1
+
+    def merge(self, other):
+        self.elapsed = max(self.elapsed, other.elapsed)
+        self.requests.update(other.requests)
+        for op in OPERATIONS:
+            self.errors[op].update(other.errors[op])
+            self.latencies[op].merge(other.latencies[op])
+
+    @property
+    def throughput(self):
+        """Completed requests per second"""
+        if not self.elapsed:
+            return 0.0
+        return sum(self.requests.values()) / self.elapsed
+
+
+def parse_mix(text):
+    """Shares of the operations from 'catalog=60,history=25,sale=10'"""
+    mix = OrderedDict()
+    for part in text.split(','):
+        op, _, share = part.partition('=')
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError("Unknown operation '{}', use one of {}"
+                             .format(op, ', '.join(OPERATIONS)))
+        mix[op] = float(share or 1)
+    if not any(share > 0 for share in mix.values()):
+        raise ValueError('The mix has no operations.')
+    return mix
+
+
+async def run_load(token, api_endpoint, mix, rate=50.0, duration=30.0,
+                   sessions=20, workers=1, seed=0):
+    """Send rate requests per second for duration seconds, with the shares
+    of operations of mix, over concurrent sessions. With several workers,
+    rate and sessions are split among as many processes.
+
+    Requests are scheduled at fixed times. If all sessions are busy, the
+    request waits for one and the wait counts into its latency, such that
+    a saturated server shows in the latencies, not in a lower rate only.
+    Returns a LoadResult.
+    """
+    if workers <= 1:
+        return await _worker(token, api_endpoint, mix, rate, duration,
+                             sessions, seed)
+
+    from concurrent.futures import ProcessPoolExecutor
+    loop = asyncio.get_event_loop()
+    with ProcessPoolExecutor(workers) as pool:
+        results = await asyncio.gather(*[
+            loop.run_in_executor(
+                pool, _worker_process, token, api_endpoint, mix,
+                rate / workers, duration, max(1, sessions // workers),
+                seed + i)
+            for i in range(workers)])
+    result = LoadResult(rate, duration)
+    for r in results:
+        result.merge(r)
+    return result
+
+
+def _worker_process(*args):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_worker(*args))
+    finally:
+        loop.close()
+
+
+async def _worker(token, api_endpoint, mix, rate, duration, sessions, seed):
+    loop = asyncio.get_event_loop()
+    rnd = random.Random(seed)
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+    result = LoadResult(rate, duration)
+
+    # no retries or rate limits, every request counts as sent
+    clients = [DmsClient(token, api_endpoint, middlewares=[],
+                         session_options={'limit_per_host': 1})
+               for _ in range(sessions)]
+    for client in clients:
+        client.connect()
+    try:
+        products, profiles = await asyncio.gather(clients[0].products,
+                                                  clients[0].profiles)
+        products = [p.id for p in products if p.quantity > 0]
+        profiles = [p.id for p in profiles if p.allowed_buy]
+        if ((mix.get('sale') or mix.get('order')) and
+                not (products and profiles)):
+            raise ValueError('No products in stock or profiles allowed to '
+                             'buy for writes.')
+
+        idle = asyncio.Queue()
+        for client in clients:
+            idle.put_nowait(client)
+        tasks = set()
+
+        async def send(client, op, scheduled):
+            error = None
+            try:
+                await _operation(client, op, rnd, products, profiles)
+            except Exception as e:
+                error = _error_name(e)
+            result.record(op, loop.time() - scheduled, error)
+            idle.put_nowait(client)
+
+        start = loop.time()
+        for n in range(int(rate * duration)):
+            scheduled = start + n / rate
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            client = await idle.get()
+            op = rnd.choices(ops, weights)[0]
+            task = loop.create_task(send(client, op, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        result.elapsed = loop.time() - start
+    finally:
+        for client in clients:
+            await client._disconnect()
+    return result
+
+
+async def _operation(client, op, rnd, products, profiles):
+    if op == 'catalog':
+        if rnd.random() < 0.5:
+            await client.products
+        else:
+            await client.profiles
+    elif op == 'history':
+        await client.sale_history(1)
+    elif op == 'sale':
+        await client.add_sale(rnd.choice(products), rnd.choice(profiles))
+    elif op == 'order':
+        await client.add_order(rnd.choice(products), rnd.choice(profiles))
+
+
+def _error_name(error):
+    status = getattr(error, 'status', None)
+    if status is not None:
+        return 'HTTP {}'.format(status)
+    return type(error).__name__
+
+
+def format_report(result):
+    """Tables of throughput, errors and latencies of a LoadResult"""
+    from tabulate import tabulate
+
+    def ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 1)
+
+    lines = ['{} requests in {:.1f} s, {:.1f} per second (target {}).'
+             .format(sum(result.requests.values()), result.elapsed,
+                     result.throughput, result.rate),
+             '']
+    rows = []
+    for op in OPERATIONS:
+        n = result.requests[op]
+        if not n:
+            continue
+        errors = sum(result.errors[op].values())
+        h = result.latencies[op]
+        rows.append((op, n, errors, '{:.1f}'.format(100 * errors / n),
+                     ms(h.percentile(50)), ms(h.percentile(90)),
+                     ms(h.percentile(99)), ms(h.max)))
+    lines.append(tabulate(rows, headers=['Operation', 'Requests', 'Errors',
+                                         'Error %', 'p50 ms', 'p90 ms',
+                                         'p99 ms', 'Max ms']))
+    errors = Counter()
+    for op in OPERATIONS:
+        errors.update({(op, e): n for e, n in result.errors[op].items()})
+    if errors:
+        lines.append('')
+        lines.append(tabulate(((op, e, n) for (op, e), n
+                               in errors.most_common()),
+                              headers=['Operation', 'Error', 'Count']))
+
+    total = LatencyHistogram()
+    for h in result.latencies.values():
+        total.merge(h)
+    counts = [(bound, n) for bound, n in total.coarse() if n]
+    if counts:
+        widest = max(n for _, n in counts)
+        lines.append('')
+        lines.append(tabulate(
+            (('<= {:g}'.format(bound * 1000) if bound else 'more', n,
+              '#' * int(math.ceil(40 * n / widest)))
+             for bound, n in counts),
+            headers=['Latency ms', 'Requests', '']))
+    return '\n'.join(lines)
+
+
+def main():
+    from docopt import docopt
+    args = docopt(__doc__)
+    mix = parse_mix(args['--mix'])
+
+    async def run():
+        fake = None
+        api, token = args['<api>'], args['<token>']
+        if args['--fake']:
+            from dmsclient.fakeserver import FakeDms
+            fake = FakeDms(latency=float(args['--latency']))
+            api, token = await fake.start(), 'loadtest'
+        try:
+            return await run_load(token, api, mix,
+                                  rate=float(args['--rate']),
+                                  duration=float(args['--duration']),
+                                  sessions=int(args['--sessions']),
+                                  workers=int(args['--workers']))
+        finally:
+            if fake is not None:
+                await fake.stop()
+
+    loop = asyncio.get_event_loop()
+    print(format_report(loop.run_until_complete(run())))
+
+
+if __name__ == "__main__":
+    main()
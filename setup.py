@@ -14,7 +14,6 @@ setup(name='dmsclient',
       install_requires=[
           'aiohttp>=3.1.1',
           'docopt>=0.6.0',
-          'requests>=2.18.0',
           'tabulate>=0.7.0',
           'infi.docopt-completion>=0.2.8',
       ],
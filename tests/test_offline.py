@@ -0,0 +1,84 @@
+"""dms buy against a stopped DMS, from the cache and into the journal"""
+import asyncio
+import os
+import subprocess
+import sys
+
+import dmsclient as dms
+
+from dmsclient.fakeserver import FakeDms
+
+STALE = {'/products/': 0, '/profiles/': 0, '/profiles/current/': 0}
+
+
+def fill_cache(cache_path):
+    """Cache the catalog of a FakeDms, stop it and return its url"""
+    async def run():
+        fake = FakeDms(num_profiles=9, num_products=9, num_sales=0)
+        fake.products[6]['quantity'] = 10
+        url = await fake.start()
+        try:
+            async with dms.DmsClient('abcdef', url,
+                                     cache=dms.DmsCache(cache_path)) as c:
+                await asyncio.gather(c.products, c.profiles,
+                                     c.current_profile)
+        finally:
+            await fake.stop()
+        return url
+    return asyncio.run(run())
+
+
+def test_client_offline(tmp_path):
+    cache_path = str(tmp_path / 'cache')
+    url = fill_cache(cache_path)
+    journal = dms.WriteJournal(str(tmp_path / 'journal.jsonl'))
+
+    async def run():
+        async with dms.DmsClient('abcdef', url, middlewares=[],
+                                 cache=dms.DmsCache(cache_path, STALE),
+                                 journal=journal) as c:
+            products = await c.search_products('product 7')
+            current = await c.current_profile
+            user = await c.profile_by_id(2)
+            product = await c.product_by_id(7)
+            journaled = not await c.add_sale(product.id, user.id)
+        return products, current, user, product, journaled
+
+    products, current, user, product, journaled = asyncio.run(run())
+    assert products[0].name == 'Product 7'
+    assert current.id == 1
+    assert user.name == 'First2 Last2'
+    assert product.name == 'Product 7'
+    assert journaled
+    assert [e['data'] for e in journal.entries()] == [
+        {'profile': 2, 'product': 7}]
+
+
+def test_buy_offline(tmp_path):
+    cache_path = str(tmp_path / 'cache')
+    url = fill_cache(cache_path)
+    with open(str(tmp_path / '.dmsrc'), 'w') as f:
+        f.write('[GENERAL]\napi = {}\ntoken = abcdef\njournal = {}\n\n'
+                '[CACHE]\npath = {}\nproducts = 0\nprofiles = 0\n'
+                .format(url, tmp_path / 'journal.jsonl', cache_path))
+    env = dict(os.environ, HOME=str(tmp_path))
+
+    for argv in (['buy', '-f', 'product 7'],
+                 ['buy', '-f', '-u', 'first2 last2', 'product 7'],
+                 ['buy', '-f', '-u', '2', '7']):
+        done = subprocess.run([sys.executable, '-m', 'dmsclient.cli'] + argv,
+                              env=env, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,
+                              universal_newlines=True, timeout=60)
+        assert done.returncode == 0, done.stdout
+        assert "journaled for 'dms replay'" in done.stdout
+
+    done = subprocess.run([sys.executable, '-m', 'dmsclient.cli',
+                           'show', 'sales'],
+                          env=env, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True, timeout=60)
+    assert done.returncode == 1
+    assert done.stdout.startswith('DMS not reachable')
+    assert len(dms.WriteJournal(str(tmp_path / 'journal.jsonl'))) == 3